@@ -0,0 +1,108 @@
+"""
+This module keeps the data of successful Debank API responses in a small SQLite database.
+
+Responses are stored by request key (endpoint path and query) and reused for API_CACHE_TTL
+seconds, so repeated menu actions and re-runs of the script, e.g. after reducing the number
+of threads because Cloudflare blocked a run, skip the network for data already fetched.
+
+Functions:
+- get_cached: Returns the cached data for a key if it is fresh enough.
+- set_cached: Stores the data for a key.
+- set_cache_ttl: Changes how long cached data is reused.
+- close_cache: Closes the cache database.
+"""
+
+import atexit
+import sqlite3
+import threading
+from time import time
+
+import orjson
+
+from app.config import API_CACHE_TTL, FILE_API_CACHE
+
+CACHE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS api_response (
+    key TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    data BLOB NOT NULL
+)
+"""
+
+CACHE_UPSERT_SQL = """
+INSERT INTO api_response (key, fetched_at, data) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET fetched_at = excluded.fetched_at, data = excluded.data
+"""
+
+# Settings changed from the command line; a TTL of 0 disables reading from the cache
+_settings = {'ttl': API_CACHE_TTL}
+
+# One connection shared by all worker threads, opened on first use
+_connection = []
+_lock = threading.Lock()
+
+def _get_connection():
+    """
+    Returns the connection to the cache database, opening it on first use.
+
+    Must be called with _lock held.
+
+    Returns:
+        sqlite3.Connection: A connection in autocommit mode, usable from any thread.
+    """
+    if not _connection:
+        conn = sqlite3.connect(FILE_API_CACHE, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(CACHE_SCHEMA_SQL)
+        _connection.append(conn)
+    return _connection[0]
+
+def get_cached(key):
+    """
+    Returns the data cached for a request if it was fetched less than the cache TTL ago.
+
+    Args:
+        key (str): The request key.
+
+    Returns:
+        The cached data, or None if there is no fresh entry.
+    """
+    if _settings['ttl'] <= 0:
+        return None
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT data FROM api_response WHERE key = ? AND fetched_at > ?",
+            (key, time() - _settings['ttl'])
+        ).fetchone()
+    return None if row is None else orjson.loads(row[0])
+
+def set_cached(key, data):
+    """
+    Stores the data of a successful response.
+
+    Args:
+        key (str): The request key.
+        data: The JSON-serialisable data to store.
+    """
+    with _lock:
+        _get_connection().execute(CACHE_UPSERT_SQL, (key, time(), orjson.dumps(data)))
+
+def set_cache_ttl(ttl):
+    """
+    Changes how long cached data is reused.
+
+    Args:
+        ttl (float): The maximum age of reused data in seconds; 0 disables reading from the cache.
+    """
+    _settings['ttl'] = ttl
+
+def close_cache():
+    """
+    Closes the cache database if it was opened. Registered with atexit.
+    """
+    with _lock:
+        while _connection:
+            _connection.pop().close()
+
+atexit.register(close_cache)
@@ -2,12 +2,23 @@
 This module defines various cell format dictionaries used for styling
 Excel cells in the application. These formats include header formats,
 wallets column formats, and total cell formats.
+
+The dictionaries are wrapped in read-only mappings: they are shared by every
+workbook the application writes and must not be mutated by callers.
 """
 
+from types import MappingProxyType
+
 from app.config import BLACK_COLOR
 
-header_format_dict = {
-    'font_color': '#000000' if BLACK_COLOR else '#ffffff',
+HEADER_FONT_COLOR = '#000000' if BLACK_COLOR else '#ffffff'
+
+# Excel number formats: values are written as numbers and only displayed rounded
+USD_NUM_FORMAT = '$#,##0.00'
+AMOUNT_NUM_FORMAT = '0.0000'
+
+header_format_dict = MappingProxyType({
+    'font_color': HEADER_FONT_COLOR,
     'font_size': 14,
     'bg_color': '#339c5d',
     'bold': True,
@@ -15,9 +26,9 @@ header_format_dict = {
     'valign': 'vcenter',
     'text_wrap': True,
     'border': 1
-}
+})
 
-wallets_column_format_dict = {
+wallets_column_format_dict = MappingProxyType({
     'font_size': 12,
     'bg_color': '#e0f2f1',
     'bold': True,
@@ -25,9 +36,9 @@ wallets_column_format_dict = {
     'valign': 'vcenter',
     'text_wrap': True,
     'border': 1
-}
+})
 
-total_cell_format_dict = {
+total_cell_format_dict = MappingProxyType({
     'font_size': 12,
     'bg_color': '#b2dfdb',
     'bold': True,
@@ -35,28 +46,69 @@ total_cell_format_dict = {
     'valign': 'vcenter',
     'text_wrap': True,
     'border': 1
-}
+})
 
-common_ceil_format_dict = {
+common_ceil_format_dict = MappingProxyType({
     'align': 'center',
     'valign': 'vcenter',
     'text_wrap': True,
-}
+})
 
-usd_ceil_format_dict = {
+common_amount_format_dict = MappingProxyType({
+    **common_ceil_format_dict,
+    'num_format': AMOUNT_NUM_FORMAT,
+})
+
+common_usd_format_dict = MappingProxyType({
+    **common_ceil_format_dict,
+    'num_format': USD_NUM_FORMAT,
+})
+
+# USD cells always hold a single line, so they skip text wrapping
+usd_ceil_format_dict = MappingProxyType({
     'bg_color': '#e0f2f1',
     'align': 'center',
     'valign': 'vcenter',
-    'text_wrap': True,
     'bold': True,
-    'border': 1
-}
+    'border': 1,
+    'num_format': USD_NUM_FORMAT,
+})
+
+# Coin amounts in the totals row share the USD cell style
+total_amount_format_dict = MappingProxyType({
+    **usd_ceil_format_dict,
+    'num_format': AMOUNT_NUM_FORMAT,
+})
 
-donate_cell_format_dict = {
+donate_cell_format_dict = MappingProxyType({
     'font_size': 11,
     'bold': True,
     'align': 'center',
     'valign': 'vcenter',
     'text_wrap': True,
     'border': 1
-}
+})
+
+FORMAT_SPECS = MappingProxyType({
+    'header': header_format_dict,
+    'wallets_column': wallets_column_format_dict,
+    'total_cell': total_cell_format_dict,
+    'common_cell': common_ceil_format_dict,
+    'common_amount_cell': common_amount_format_dict,
+    'common_usd_cell': common_usd_format_dict,
+    'usd_cell': usd_ceil_format_dict,
+    'total_amount_cell': total_amount_format_dict,
+    'donate_cell': donate_cell_format_dict,
+})
+
+def build_formats(workbook):
+    """
+    Create every cell format once for the given workbook.
+
+    Args:
+    workbook (Workbook): The xlsxwriter workbook the formats belong to.
+
+    Returns:
+    dict: Format objects keyed by the names in FORMAT_SPECS.
+    """
+    return {name: workbook.add_format(spec) for name, spec in FORMAT_SPECS.items()}
@@ -6,7 +6,9 @@ This module sets various configuration parameters and logging settings used thro
 Attributes:
     BLACK_COLOR (bool): Flag to change table display color if displayed incorrectly.
     SLEEP_TIME (float): Time to sleep between requests to avoid TOO MANY REQUESTS errors.
-    NODE_SLEEP_TIME (float): Time to sleep between node operations, adjust based on computer performance.
+    DISCOVERY_THREADS (int): Worker threads for the used chains and pools requests made before balances are fetched.
+    API_CACHE_TTL (float): Seconds a successful API response is reused before it is requested again.
+    FILE_API_CACHE (str): Path to the SQLite database caching API responses.
     FILE_JS (str): Path to the main JavaScript file.
     FILE_EXCEL (str): Path to the Excel file used for storing data.
     FILE_WALLETS (str): Path to the text file containing wallet addresses.
@@ -15,20 +17,24 @@ Attributes:
 
 Logging:
     Configures the loguru logger to log messages to both stderr and a log file with a specific format.
+    The file sink is enqueued so writes happen off the calling thread.
 """
 
 from sys import stderr
 from loguru import logger
 BLACK_COLOR = False # change to True if the table is displayed incorrectly
 SLEEP_TIME = 0.5 # if you get a TOO MANY REQUESTS error, increase the sleep time between requests here
-NODE_SLEEP_TIME = 0.1 # increase if your computer is a potato
+DISCOVERY_THREADS = 3 # used chains / pools are strongly rate-limited by Cloudflare, set to 1 if you get blocked
+API_CACHE_TTL = 600 # repeated menu actions and runs within this many seconds reuse the fetched chains, pools and balances
 FILE_JS = 'js/main.js'
 FILE_EXCEL = 'DEBANK.xlsx'
 FILE_WALLETS = 'wallets.txt'
 DB_FILE = 'db/portfolio_history.db'
 SCHEMA_FILE = 'db/schema.sql'
+FILE_API_CACHE = 'db/api_cache.db'
 # LOGGING SETTING
 FILE_LOG = 'logs/log.log'
 logger.remove()
 logger.add(stderr, format="<white>{time:HH:mm:ss}</white> | <level>{level: <8}</level> | <cyan>{line}</cyan> - <white>{message}</white>")
-logger.add(FILE_LOG, format="<white>{time:HH:mm:ss}</white> | <level>{level: <8}</level> | <cyan>{line}</cyan> - <white>{message}</white>")
+# the file sink is written from loguru's background thread so logging never blocks on disk I/O
+logger.add(FILE_LOG, format="{time:HH:mm:ss} | {level: <8} | {line} - {message}", enqueue=True)
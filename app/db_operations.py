@@ -10,12 +10,53 @@ Functions:
 - delete_pool_data: Deletes a record from the pool table.
 """
 
+import atexit
+import itertools
 import sqlite3
-from contextlib import closing
+from contextlib import contextmanager
+
+from loguru import logger
+
+# Oldest SQLite builds cap a statement at 999 bound variables
+SQLITE_MAX_VARIABLES = 999
+
+WALLET_TOKEN_INSERT_SQL = """
+INSERT INTO wallet_token (import_run_id, token_id, wallet_id, chain_id, quantity, token_price, value)
+VALUES
+"""
+
+POOL_INSERT_SQL = """
+INSERT INTO pool (import_run_id, token_id, wallet_id, chain_id, protocol_id, quantity, token_price, value)
+VALUES
+"""
+
+# Returns the id of the protocol whether it was just inserted or already existed (SQLite >= 3.35)
+PROTOCOL_UPSERT_SQL = """
+INSERT INTO protocol (name) VALUES (?)
+ON CONFLICT (name) DO UPDATE SET name = excluded.name
+RETURNING id
+"""
+
+# Open connections keyed by database file, reused across imports in one process
+_connections = {}
 
 def get_db_connection(db_file):
     """
-    Establishes a connection to the SQLite database specified by db_file.
+    Returns the connection to the SQLite database specified by db_file.
+
+    The connection is opened and configured on first use and then reused, so
+    repeated imports keep its statement cache. It is closed at interpreter exit
+    by close_db_connections.
+
+    The connection is switched to WAL journaling with synchronous=NORMAL so a bulk
+    import does not pay a full fsync per commit, and temp storage and page cache are
+    kept in memory. It runs in autocommit mode; writers open their own transaction
+    with immediate_transaction.
+
+    The connection is meant for the import writer only: it holds the database file
+    lock exclusively until it is closed and reads pages through mmap, so other
+    processes (e.g. reports) cannot read the database until close_db_connections
+    is called or the process exits.
 
     Args:
         db_file (str): The path to the SQLite database file.
@@ -23,7 +64,130 @@ def get_db_connection(db_file):
     Returns:
         sqlite3.Connection: A connection object to the SQLite database.
     """
-    return sqlite3.connect(db_file)
+    conn = _connections.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, cached_statements=256, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
+        conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+        conn.execute("PRAGMA mmap_size=268435456")
+        _connections[db_file] = conn
+    return conn
+
+def close_db_connections():
+    """
+    Closes every connection opened by get_db_connection.
+
+    Registered with atexit; can also be called directly to release the database lock.
+    """
+    while _connections:
+        _, conn = _connections.popitem()
+        conn.close()
+
+atexit.register(close_db_connections)
+
+@contextmanager
+def immediate_transaction(conn):
+    """
+    Runs the enclosed block in a single BEGIN IMMEDIATE transaction.
+
+    The write lock is taken up front instead of being upgraded on the first write,
+    the transaction is committed on success and rolled back on any exception.
+
+    Args:
+        conn (sqlite3.Connection): A connection opened in autocommit mode.
+
+    Yields:
+        sqlite3.Connection: The same connection.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def insert_rows(cursor, insert_sql, rows):
+    """
+    Inserts rows using multi-row VALUES statements.
+
+    Rows are grouped so that each statement binds at most SQLITE_MAX_VARIABLES
+    parameters, which lets SQLite write many rows per executed statement.
+
+    Args:
+        cursor (sqlite3.Cursor): The cursor to execute the statements on.
+        insert_sql (str): An INSERT statement ending with the VALUES keyword.
+        rows (iterable): Parameter tuples, all of the same length.
+
+    Returns:
+        int: The number of inserted rows.
+    """
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        return 0
+    rows = itertools.chain((first_row,), rows)
+
+    batch_size = SQLITE_MAX_VARIABLES // len(first_row)
+    row_placeholders = f"({', '.join('?' * len(first_row))})"
+    full_batch_sql = insert_sql + ', '.join([row_placeholders] * batch_size)
+
+    count = 0
+    while batch := list(itertools.islice(rows, batch_size)):
+        if len(batch) == batch_size:
+            sql = full_batch_sql
+        else:
+            sql = insert_sql + ', '.join([row_placeholders] * len(batch))
+        cursor.execute(sql, [value for row in batch for value in row])
+        count += len(batch)
+    return count
+
+def split_pool_name(pool_name):
+    """
+    Splits a pool name of the form "Protocol name (chain)" into its parts.
+
+    Args:
+        pool_name (str): The pool name as built by get_pools.
+
+    Returns:
+        tuple: The protocol name and the chain name.
+    """
+    protocol_name, chain_name = pool_name.rsplit(' ', 1)
+    return protocol_name, chain_name.strip('()')
+
+def _token_rows(import_run_id, groups, wallet_lookup, token_lookup):
+    """
+    Yields wallet_token or pool rows for every token of every wallet in every group.
+
+    Both tables share the same layout apart from the ids that identify the group
+    (chain id for wallet_token, chain and protocol ids for pool), so one generator
+    builds the rows for both and the data is streamed into insert_rows without an
+    intermediate list. Tokens with an unknown (None) price are skipped.
+
+    Args:
+        import_run_id (int): The id of the current import run.
+        groups (iterable): Pairs of (group ids tuple, dict mapping wallets to token lists).
+        wallet_lookup (dict): Maps wallet addresses to wallet ids.
+        token_lookup (dict): Maps token names to token ids.
+
+    Yields:
+        tuple: Parameters for WALLET_TOKEN_INSERT_SQL or POOL_INSERT_SQL.
+    """
+    for group_ids, wallet_tokens in groups:
+        for wallet, tokens in wallet_tokens.items():
+            wallet_id = wallet_lookup[wallet]
+            for token in tokens:
+                amount, price = token['amount'], token['price']
+                # Tokens without a known price cannot be valued and the price column is NOT NULL
+                if price is None:
+                    continue
+                yield (
+                    import_run_id, token_lookup[token['name']], wallet_id, *group_ids,
+                    amount, price, amount * price
+                )
 
 def save_to_database(db_file, wallets, chains, coins, pools):
     """
@@ -39,98 +203,69 @@ def save_to_database(db_file, wallets, chains, coins, pools):
     Returns:
         None
     """
-    print(f'inserting data to {db_file}')
-    with closing(get_db_connection(db_file)) as conn:
-        with conn:
-            cursor = conn.cursor()
-
-            # Create a new import run
-            cursor.execute("INSERT INTO import_run DEFAULT VALUES")
-            import_run_id = cursor.lastrowid
-            print(f"Created new import run with ID: {import_run_id}")
-
-            # Insert wallets
-            cursor.executemany("INSERT OR IGNORE INTO wallet (address) VALUES (?)",
-                               [(wallet,) for wallet in wallets])
-            print(f"Inserted {len(wallets)} wallets")
-
-            # Insert chains
-            cursor.executemany("INSERT OR IGNORE INTO chain (name) VALUES (?)",
-                               [(chain,) for chain in chains])
-            print(f"Inserted {len(chains)} chains")
-
-            # Prepare token lookup
+    # Split "Protocol (chain)" pool names before touching the database
+    parsed_pools = [(*split_pool_name(pool_name), pool_data) for pool_name, pool_data in pools.items()]
+
+    conn = get_db_connection(db_file)
+    with immediate_transaction(conn):
+        cursor = conn.cursor()
+
+        # Create a new import run
+        cursor.execute("INSERT INTO import_run DEFAULT VALUES")
+        import_run_id = cursor.lastrowid
+
+        # Insert wallets
+        cursor.executemany("INSERT OR IGNORE INTO wallet (address) VALUES (?)",
+                           ((wallet,) for wallet in wallets))
+
+        # Insert chains
+        cursor.executemany("INSERT OR IGNORE INTO chain (name) VALUES (?)",
+                           ((chain,) for chain in chains))
+
+        # Prepare chain and wallet lookups
+        cursor.execute("SELECT id, name FROM chain")
+        chain_lookup = {name: id for id, name in cursor.fetchall()}
+        cursor.execute("SELECT id, address FROM wallet")
+        wallet_lookup = {address: id for id, address in cursor.fetchall()}
+
+        # Insert all unseen tokens in one batch, then prepare token lookup
+        cursor.execute("SELECT id, name FROM token")
+        token_lookup = {name: id for id, name in cursor.fetchall()}
+        token_names = {
+            token['name']
+            for source in (*coins.values(), *pools.values())
+            for tokens in source.values()
+            for token in tokens
+        }
+        new_token_names = token_names - token_lookup.keys()
+        if new_token_names:
+            cursor.executemany("INSERT INTO token (name) VALUES (?)",
+                               [(name,) for name in new_token_names])
             cursor.execute("SELECT id, name FROM token")
             token_lookup = {name: id for id, name in cursor.fetchall()}
 
-            # Insert tokens and wallet_tokens
-
-            wallet_token_count = 0
-            for chain in coins:
-                chain_id = cursor.execute("SELECT id FROM chain WHERE name = ?", (chain,)).fetchone()[0]
-                for wallet, tokens in coins[chain].items():
-                    wallet_id = cursor.execute("SELECT id FROM wallet WHERE address = ?", (wallet,)).fetchone()[0]
-                    for token in tokens:
-                        if token['name'] not in token_lookup:
-                            cursor.execute("INSERT INTO token (name) VALUES (?)", (token['name'],))
-                            token_lookup[token['name']] = cursor.lastrowid
-                        token_id = token_lookup[token['name']]
-
-
-                        cursor.execute(
-                            """
-                            INSERT INTO wallet_token (import_run_id, token_id, wallet_id, chain_id, quantity, token_price, value)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                import_run_id, token_id, wallet_id, chain_id,
-                                token['amount'], token['price'], token['amount'] * token['price']
-                            )
-                        )
-                        wallet_token_count += 1
-
-            print(f"Inserted  {wallet_token_count} wallet_tokens")
-
-            # Prepare protocol lookup
-            cursor.execute("SELECT id, name FROM protocol")
-            protocol_lookup = {name: id for id, name in cursor.fetchall()}
-
-            # Insert protocols and pools
-            protocol_count = 0
-            pool_count = 0
-            for pool_name, pool_data in pools.items():
-                protocol_name, chain_name = pool_name.rsplit(' ', 1)
-                chain_name = chain_name.strip('()')
-
-                if protocol_name not in protocol_lookup:
-                    cursor.execute("INSERT INTO protocol (name) VALUES (?)", (protocol_name,))
-                    protocol_lookup[protocol_name] = cursor.lastrowid
-                protocol_id = protocol_lookup[protocol_name]
-                protocol_count += 1
-
-                chain_id = cursor.execute("SELECT id FROM chain WHERE name = ?", (chain_name,)).fetchone()[0]
-
-                for wallet, tokens in pool_data.items():
-                    wallet_id = cursor.execute("SELECT id FROM wallet WHERE address = ?", (wallet,)).fetchone()[0]
-                    for token in tokens:
-                        if token['name'] not in token_lookup:
-                            cursor.execute("INSERT INTO token (name) VALUES (?)", (token['name'],))
-                            token_lookup[token['name']] = cursor.lastrowid
-                        token_id = token_lookup[token['name']]
-
-                        cursor.execute(
-                            """
-                            INSERT INTO pool (
-                                import_run_id, token_id, wallet_id, chain_id, protocol_id, quantity, token_price, value
-                            )
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                import_run_id, token_id, wallet_id, chain_id, protocol_id,
-                                token['amount'], token['price'], token['amount'] * token['price']
-                            )
-                        )
-                        pool_count += 1
-
-    print(f"Inserted {protocol_count} protocols and {pool_count} pool entries to {db_file} database")
+        # Insert wallet_tokens
+        wallet_token_groups = (
+            ((chain_lookup[chain],), wallet_tokens) for chain, wallet_tokens in coins.items()
+        )
+        wallet_token_count = insert_rows(
+            cursor, WALLET_TOKEN_INSERT_SQL,
+            _token_rows(import_run_id, wallet_token_groups, wallet_lookup, token_lookup)
+        )
+
+        # Insert protocols and pools
+        pool_groups = []
+        for protocol_name, chain_name, pool_data in parsed_pools:
+            protocol_id = cursor.execute(PROTOCOL_UPSERT_SQL, (protocol_name,)).fetchone()[0]
+            pool_groups.append(((chain_lookup[chain_name], protocol_id), pool_data))
+        protocol_count = len(pool_groups)
+        pool_count = insert_rows(
+            cursor, POOL_INSERT_SQL,
+            _token_rows(import_run_id, pool_groups, wallet_lookup, token_lookup)
+        )
+
+    logger.info(
+        f"Import run {import_run_id} saved to {db_file}: {len(wallets)} wallets, {len(chains)} chains, "
+        f"{wallet_token_count} wallet tokens, {protocol_count} protocols, {pool_count} pool entries"
+    )
     
\ No newline at end of file
@@ -16,50 +16,81 @@ Functions:
 """
 
 import xlsxwriter
-import openpyxl
 
 from app.config import FILE_EXCEL
-from app.cell_formats import header_format_dict
-from app.cell_formats import wallets_column_format_dict
-from app.cell_formats import total_cell_format_dict
-from app.cell_formats import common_ceil_format_dict
-from app.cell_formats import usd_ceil_format_dict
-from app.cell_formats import donate_cell_format_dict
+from app.cell_formats import build_formats
 
-def adjust_column_width(filename):
+def cell_width(value):
     """
-    Adjusts the width of columns in an Excel worksheet based on the maximum length of the content in each column.
+    Returns the number of characters a value takes up in its cell.
+
+    Numbers are measured as they are displayed with the report number formats
+    (thousands separators, up to four decimals); text by its longest line.
+
+    Args:
+        value (str or float): The cell value.
+
+    Returns:
+        int: The width of the value in characters.
+    """
+    if isinstance(value, str):
+        return max(map(len, value.split('\n')))
+    return len(f'{value:,.4f}')
+
+def write_cell(worksheet, col_widths, row, col, value, cell_format):
+    """
+    Writes a cell and records its width for the column widths.
+
+    Args:
+        worksheet (Worksheet): The Excel worksheet object.
+        col_widths (dict): Maps column indexes to the widest content seen so far.
+        row (int): The row index.
+        col (int): The column index.
+        value (str or float): The value to write.
+        cell_format (Format): The Excel cell format to use.
+
+    Returns:
+        None
+    """
+    worksheet.write(row, col, value, cell_format)
+    col_widths[col] = max(col_widths.get(col, 0), cell_width(value))
+
+def write_cells(worksheet, col_widths, row, first_col, values, cell_format):
+    """
+    Writes consecutive cells of a row with write_row and records their widths
+    for the column widths.
 
     Args:
-        filename (str): The path to the Excel file to be adjusted.
+        worksheet (Worksheet): The Excel worksheet object.
+        col_widths (dict): Maps column indexes to the widest content seen so far.
+        row (int): The row index.
+        first_col (int): The column index of the first value.
+        values (list): The values to write.
+        cell_format (Format): The Excel cell format to use.
 
     Returns:
         None
     """
-    workbook = openpyxl.load_workbook(filename)
-    sheet = workbook.active
+    worksheet.write_row(row, first_col, values, cell_format)
+    for col, value in enumerate(values, start=first_col):
+        col_widths[col] = max(col_widths.get(col, 0), cell_width(value))
 
-    column_max_length = [0] * sheet.max_column
+def set_column_widths(worksheet, col_widths):
+    """
+    Sets the width of every data column to fit its content, with a minimum of 10.
 
-    ya_ustal = 0
-    for row in sheet.iter_rows(values_only=True):
-        if ya_ustal != 0:
-            for idx, cell_value in enumerate(row):
-                width = 0
-                if cell_value is not None:
-                    strs = str(cell_value).split('\n')
-                    for i in strs:
-                        width = max(width, len(i))
+    The first column holds the wallet addresses and keeps its own fixed width.
 
-                    cell_length = width
-                    if cell_length > column_max_length[idx]:
-                        column_max_length[idx] = cell_length
-        ya_ustal += 1
-    for col_idx, max_length in enumerate(column_max_length[1:], start=2):
-        col_letter = openpyxl.utils.get_column_letter(col_idx)
-        sheet.column_dimensions[col_letter].width = 10 if max_length < 10 else max_length
+    Args:
+        worksheet (Worksheet): The Excel worksheet object.
+        col_widths (dict): Maps column indexes to the widest content written to them.
 
-    workbook.save(filename)
+    Returns:
+        None
+    """
+    for col, width in col_widths.items():
+        if col > 0:
+            worksheet.set_column(col, col, max(10, width))
 
 
 def save_full_to_excel(wallets, chains, coins, balances):
@@ -75,69 +106,62 @@ def save_full_to_excel(wallets, chains, coins, balances):
     Returns:
         None
     """
-    workbook = xlsxwriter.Workbook(FILE_EXCEL)
+    # constant_memory flushes each row to disk once the next one starts, so every
+    # row has to be written completely and in ascending order
+    workbook = xlsxwriter.Workbook(FILE_EXCEL, {'constant_memory': True})
     worksheet = workbook.add_worksheet("Coins")
 
-    header_format = workbook.add_format(header_format_dict)
-    wallets_column_format = workbook.add_format(wallets_column_format_dict)
-    total_cell_format = workbook.add_format(total_cell_format_dict)
-    common_ceil_format = workbook.add_format(common_ceil_format_dict)
-    usd_ceil_format = workbook.add_format(usd_ceil_format_dict)
-    donate_cell_format = workbook.add_format(donate_cell_format_dict)
+    formats = build_formats(workbook)
+    col_widths = {}
 
     headers = ['Wallet', *[chain.upper() for chain in chains], 'CHAINS', 'TOTAL']
 
-    for row_id, wallet in enumerate(wallets):
-        worksheet.write(row_id + 1, 0, wallet, wallets_column_format)
-    worksheet.write(len(wallets) + 1, 0, 'TOTAL IN USD', total_cell_format)
-
+    # One pass over the coins builds the cell texts and both sets of totals
+    cells = [[''] * len(chains) for _ in wallets]
+    wallet_totals = [0.0] * len(wallets)
+    chain_totals = [0.0] * len(chains)
+    for chain_idx, chain in enumerate(chains):
+        chain_coins = coins[chain]
+        for wallet_idx, wallet in enumerate(wallets):
+            lines = []
+            for coin in chain_coins[wallet]:
+                if coin["price"] is None:
+                    coin_in_usd = '?'
+                else:
+                    coin_in_usd = round(coin["amount"] * coin["price"], 2)
+                    wallet_totals[wallet_idx] += coin_in_usd
+                    chain_totals[chain_idx] += coin_in_usd
+                lines.append(f'{coin["ticker"]} - {round(coin["amount"], 4)} (${coin_in_usd})')
+            cells[wallet_idx][chain_idx] = '\n'.join(lines) if lines else '--'
 
-    for col_id, chain in enumerate(headers):
-        worksheet.write(0, col_id, chain, header_format)
 
+    worksheet.set_row(0, 35)
+    worksheet.set_column(0, 0, 52)
 
-    for col_id, chain in enumerate(chains):
-        total_in_chain = 0.0
-        for row_id, wallet in enumerate(wallets):
-            cell = ''
-            for coin in coins[chain][wallet]:
-                coin_in_usd = '?' if (coin["price"] is None) else round(coin["amount"] * coin["price"], 2)
-                cell += f'{coin["ticker"]} - {round(coin["amount"], 4)} (${coin_in_usd})\n'
-                total_in_chain += coin_in_usd if isinstance(coin_in_usd, float) else 0
-            if cell == '':
-                cell = '--'
-            cell = cell[:-1]
-            worksheet.write(row_id + 1, col_id + 1, cell, common_ceil_format)
-        worksheet.write(len(wallets) + 1, col_id + 1, f'${round(total_in_chain, 2)}', usd_ceil_format)
-
+    worksheet.write_row(0, 0, headers, formats['header'])
 
     total_usd = 0.0
     total_all_chains = 0.0
-    for row_id, wallet in enumerate(wallets):
-        total_in_wallet = 0.0
-        for chain in chains:
-            for coin in coins[chain][wallet]:
-                coin_in_usd = 0 if (coin["price"] is None) else round(coin["amount"] * coin["price"], 2)
-                total_in_wallet += coin_in_usd
+    for row_id, (wallet, wallet_cells, total_in_wallet) in enumerate(zip(wallets, cells, wallet_totals), start=1):
+        worksheet.write(row_id, 0, wallet, formats['wallets_column'])
+        write_cells(worksheet, col_widths, row_id, 1, wallet_cells, formats['common_cell'])
         total_usd += total_in_wallet
         total_all_chains += balances[wallet]
-        worksheet.write(row_id + 1, len(headers) - 2, f'${round(total_in_wallet, 2)}', usd_ceil_format)
-        worksheet.write(row_id + 1, len(headers) - 1, f'${round(balances[wallet], 2)}', usd_ceil_format)
-    worksheet.write(len(wallets) + 1, len(headers) - 2, f'${round(total_usd, 2)}', usd_ceil_format)
-    worksheet.write(len(wallets) + 1, len(headers) - 1, f'${round(total_all_chains, 2)}', usd_ceil_format)
+        write_cells(worksheet, col_widths, row_id, len(headers) - 2,
+                    [total_in_wallet, balances[wallet]], formats['usd_cell'])
 
+    worksheet.write(len(wallets) + 1, 0, 'TOTAL IN USD', formats['total_cell'])
+    write_cells(worksheet, col_widths, len(wallets) + 1, 1, chain_totals, formats['usd_cell'])
+    write_cells(worksheet, col_widths, len(wallets) + 1, len(headers) - 2,
+                [total_usd, total_all_chains], formats['usd_cell'])
 
-    worksheet.write(len(wallets) + 3, 0, 'Donate:', donate_cell_format)
-    worksheet.write(len(wallets) + 4, 0, '0x2e69Da32b0F7e75549F920CD2aCB0532Cc2aF0E7', donate_cell_format)
 
+    worksheet.write(len(wallets) + 3, 0, 'Donate:', formats['donate_cell'])
+    worksheet.write(len(wallets) + 4, 0, '0x2e69Da32b0F7e75549F920CD2aCB0532Cc2aF0E7', formats['donate_cell'])
 
-    worksheet.set_row(0, 35)
-    worksheet.set_column(0, 0, 52)
-
+    set_column_widths(worksheet, col_widths)
     workbook.close()
 
-    adjust_column_width(FILE_EXCEL)
-
 
 def save_selected_to_excel(wallets, chains, coins, balances, ticker):
     """
@@ -153,69 +177,73 @@ def save_selected_to_excel(wallets, chains, coins, balances, ticker):
     This function orchestrates the creation of the Excel file by calling
     helper functions for different parts of the spreadsheet.
     """
-    workbook = xlsxwriter.Workbook(FILE_EXCEL)
+    workbook = xlsxwriter.Workbook(FILE_EXCEL, {'constant_memory': True})
     worksheet = workbook.add_worksheet("Coins")
 
-    formats = {
-        'header': workbook.add_format(header_format_dict),
-        'wallets_column': workbook.add_format(wallets_column_format_dict),
-        'total_cell': workbook.add_format(total_cell_format_dict),
-        'common_cell': workbook.add_format(common_ceil_format_dict),
-        'usd_cell': workbook.add_format(usd_ceil_format_dict),
-        'donate_cell': workbook.add_format(donate_cell_format_dict)
-    }
+    formats = build_formats(workbook)
+    col_widths = {}
 
     headers = ['Wallet'] + [chain.upper() for chain in chains] + ['CHAINS', 'TOTAL']
+    layout = column_layout(len(chains))
 
-    write_headers(worksheet, headers, formats['header'])
-    write_wallets(worksheet, wallets, formats['wallets_column'], formats['total_cell'])
+    # Rows are flushed in constant_memory mode, so the header row height goes first
+    format_worksheet(worksheet)
+    write_headers(worksheet, headers, layout, formats['header'])
 
-    total_usd, total_all_chains = write_data(worksheet, wallets, chains, coins, balances, ticker, formats)
+    total_usd, total_all_chains = write_data(worksheet, col_widths, layout, wallets, chains, coins, balances, ticker, formats)
 
-    write_totals(worksheet, len(wallets), len(headers), total_usd, total_all_chains, formats['usd_cell'])
+    write_totals(worksheet, col_widths, len(wallets), layout[-2][0], total_usd, total_all_chains, formats['usd_cell'])
     write_donation_info(worksheet, len(wallets), formats['donate_cell'])
 
-    format_worksheet(worksheet)
+    set_column_widths(worksheet, col_widths)
     workbook.close()
-    adjust_column_width(FILE_EXCEL)
 
-def write_headers(worksheet, headers, header_format):
+def column_layout(num_chains):
+    """
+    Compute the columns covered by each header of the selected-coin sheet.
+
+    Args:
+    num_chains (int): The number of blockchains.
+
+    Returns:
+    list: (first, last) column pairs for 'Wallet', each chain, 'CHAINS' and 'TOTAL', in header order.
+
+    Each chain spans three columns (ticker, amount, USD value); the other headers span one.
+    """
+    totals_col = 3 * num_chains + 1
+    return [
+        (0, 0),
+        *[(3 * chain_id + 1, 3 * chain_id + 3) for chain_id in range(num_chains)],
+        (totals_col, totals_col),
+        (totals_col + 1, totals_col + 1),
+    ]
+
+def write_headers(worksheet, headers, layout, header_format):
     """
     Write the header row to the worksheet.
 
     Args:
     worksheet (Worksheet): The Excel worksheet object.
     headers (list): List of header titles.
+    layout (list): Column ranges of the headers, as returned by column_layout.
     header_format (Format): The Excel cell format for headers.
 
     This function writes the headers and merges cells for multi-column headers.
     """
-    for col_id, header in enumerate(headers):
-        if col_id == 0 or col_id >= len(headers) - 2:
-            worksheet.write(0, col_id + (len(headers) - 3) * 2, header, header_format)
+    for (first_col, last_col), header in zip(layout, headers):
+        if first_col == last_col:
+            worksheet.write(0, first_col, header, header_format)
         else:
-            worksheet.merge_range(0, col_id - 2 + 2 * col_id, 0, col_id + 2 * col_id, header, header_format)
-
-def write_wallets(worksheet, wallets, wallet_format, total_format):
-    """
-    Write the wallet addresses and the 'TOTAL IN USD' row.
-
-    Args:
-    worksheet (Worksheet): The Excel worksheet object.
-    wallets (list): List of wallet addresses.
-    wallet_format (Format): The Excel cell format for wallet addresses.
-    total_format (Format): The Excel cell format for the total row.
-    """
-    for row_id, wallet in enumerate(wallets, start=1):
-        worksheet.write(row_id, 0, wallet, wallet_format)
-    worksheet.write(len(wallets) + 1, 0, 'TOTAL IN USD', total_format)
+            worksheet.merge_range(0, first_col, 0, last_col, header, header_format)
 
-def write_data(worksheet, wallets, chains, coins, balances, ticker, formats):
+def write_data(worksheet, col_widths, layout, wallets, chains, coins, balances, ticker, formats):
     """
-    Write the main data to the worksheet.
+    Write the wallet rows and the 'TOTAL IN USD' row to the worksheet.
 
     Args:
     worksheet (Worksheet): The Excel worksheet object.
+    col_widths (dict): Column widths tracked by write_cells.
+    layout (list): Column ranges of the headers, as returned by column_layout.
     wallets (list): List of wallet addresses.
     chains (list): List of blockchain networks.
     coins (dict): Nested dictionary of coin data for each wallet and chain.
@@ -226,133 +254,137 @@ def write_data(worksheet, wallets, chains, coins, balances, ticker, formats):
     Returns:
     tuple: Total USD value and total balance across all chains.
 
-    This function writes the coin data for each wallet and chain, and calculates totals.
+    This function writes each wallet row in full (address, coin data for every chain
+    and wallet totals) before moving to the next one, and finishes with the chain totals.
     """
     total_usd = 0.0
     total_all_chains = 0.0
+    chain_totals = {chain: [0.0, 0.0] for chain in chains}
 
-    for col_id, chain in enumerate(chains):
-        total_in_chain, total_amount = write_chain_data(worksheet, wallets, chain, coins, ticker, col_id, formats)
-        write_chain_totals(worksheet, len(wallets), col_id, ticker, total_amount, total_in_chain, formats['usd_cell'])
+    col_bases = [first_col for first_col, _ in layout[1:-2]]
+    wallet_totals_base = layout[-2][0]
 
     for row_id, wallet in enumerate(wallets, start=1):
-        total_in_wallet = sum(coin["amount"] * (coin["price"] or 0)
-                              for chain in chains
-                              for coin in coins[chain][wallet]
-                              if coin['ticker'] == ticker)
+        worksheet.write(row_id, 0, wallet, formats['wallets_column'])
+        total_in_wallet = 0.0
+        for base_col, chain in zip(col_bases, chains):
+            amount, coin_in_usd, ticker_in_usd = get_coin_data(coins[chain][wallet], ticker)
+            chain_totals[chain][0] += 0 if coin_in_usd == '?' else coin_in_usd
+            chain_totals[chain][1] += amount
+            total_in_wallet += ticker_in_usd
+            write_coin_data(worksheet, col_widths, row_id, base_col, ticker, amount, coin_in_usd, formats)
+
         total_usd += total_in_wallet
         total_all_chains += balances[wallet]
-        write_wallet_totals(worksheet, row_id, len(chains), total_in_wallet, balances[wallet], formats['usd_cell'])
+        write_wallet_totals(worksheet, col_widths, row_id, wallet_totals_base, total_in_wallet, balances[wallet], formats['usd_cell'])
+
+    worksheet.write(len(wallets) + 1, 0, 'TOTAL IN USD', formats['total_cell'])
+    for base_col, chain in zip(col_bases, chains):
+        total_in_chain, total_amount = chain_totals[chain]
+        write_chain_totals(worksheet, col_widths, len(wallets), base_col, ticker, total_amount, total_in_chain, formats)
 
     return total_usd, total_all_chains
 
-def write_chain_data(worksheet, wallets, chain, coins, ticker, col_id, formats):
+def get_coin_data(wallet_coins, ticker):
     """
-    Write data for a specific blockchain.
+    Get the amount and USD value of a coin in a wallet on one blockchain.
 
     Args:
-    worksheet (Worksheet): The Excel worksheet object.
-    wallets (list): List of wallet addresses.
-    chain (str): The current blockchain being processed.
-    coins (dict): Nested dictionary of coin data for each wallet and chain.
+    wallet_coins (list): Coin data of the wallet on the blockchain.
     ticker (str): The ticker symbol of the cryptocurrency to focus on.
-    col_id (int): The column index for the current chain.
-    formats (dict): Dictionary of Excel cell formats.
 
     Returns:
-    tuple: Total value in the chain and total amount of the coin.
+    tuple: The amount of the first matching coin, its USD value ('?' if the price is unknown)
+    and the unrounded USD value of all matching coins. Amount and value are zeros if the
+    wallet has no such coin.
 
-    This function writes coin data for each wallet in a specific blockchain.
+    The coins are scanned once, so the wallet total does not need another pass over them.
     """
-    total_in_chain = 0.0
-    total_amount = 0.0
-    for row_id, wallet in enumerate(wallets, start=1):
-        coin_data = next((coin for coin in coins[chain][wallet] if coin['ticker'] == ticker), None)
-        if coin_data:
-            amount = coin_data['amount']
-            coin_in_usd = '?' if coin_data["price"] is None else round(amount * coin_data["price"], 2)
-            total_in_chain += coin_in_usd if isinstance(coin_in_usd, float) else 0
-            total_amount += amount
-        else:
-            amount, coin_in_usd = 0, 0
-        write_coin_data(worksheet, row_id, col_id, ticker, amount, coin_in_usd, formats['common_cell'])
-    return total_in_chain, total_amount
-
-def write_coin_data(worksheet, row, col, ticker, amount, coin_in_usd, cell_format):
+    coin_data = None
+    ticker_in_usd = 0.0
+    for coin in wallet_coins:
+        if coin['ticker'] == ticker:
+            coin_data = coin_data or coin
+            ticker_in_usd += coin["amount"] * (coin["price"] or 0)
+    if coin_data is None:
+        return 0, 0, ticker_in_usd
+    amount = coin_data['amount']
+    coin_in_usd = '?' if coin_data["price"] is None else amount * coin_data["price"]
+    return amount, coin_in_usd, ticker_in_usd
+
+def write_coin_data(worksheet, col_widths, row, base_col, ticker, amount, coin_in_usd, formats):
     """
     Write coin data for a single cell.
 
     Args:
     worksheet (Worksheet): The Excel worksheet object.
+    col_widths (dict): Column widths tracked by write_cells.
     row (int): The row index.
-    col (int): The column index.
+    base_col (int): The first of the three columns of the chain.
     ticker (str): The ticker symbol of the cryptocurrency.
     amount (float): The amount of the coin.
     coin_in_usd (float or str): The USD value of the coin amount.
-    cell_format (Format): The Excel cell format to use.
+    formats (dict): Dictionary of Excel cell formats.
 
     This function writes the ticker, amount, and USD value for a single coin entry.
     """
-    base_col = col - 1 + (col + 1) * 2
-    worksheet.write(row, base_col, ticker, cell_format)
-    worksheet.write(row, base_col + 1, round(amount, 4), cell_format)
-    worksheet.write(row, base_col + 2, f'${coin_in_usd}', cell_format)
+    write_cell(worksheet, col_widths, row, base_col, ticker, formats['common_cell'])
+    write_cell(worksheet, col_widths, row, base_col + 1, amount, formats['common_amount_cell'])
+    write_cell(worksheet, col_widths, row, base_col + 2, coin_in_usd, formats['common_usd_cell'])
 
-def write_chain_totals(worksheet, num_wallets, col, ticker, total_amount, total_in_chain, cell_format):
+def write_chain_totals(worksheet, col_widths, num_wallets, base_col, ticker, total_amount, total_in_chain, formats):
     """
     Write totals for a specific blockchain.
 
     Args:
     worksheet (Worksheet): The Excel worksheet object.
+    col_widths (dict): Column widths tracked by write_cells.
     num_wallets (int): The number of wallets.
-    col (int): The column index for the current chain.
+    base_col (int): The first of the three columns of the current chain.
     ticker (str): The ticker symbol of the cryptocurrency.
     total_amount (float): The total amount of the coin in this chain.
     total_in_chain (float): The total USD value in this chain.
-    cell_format (Format): The Excel cell format to use.
+    formats (dict): Dictionary of Excel cell formats.
 
     This function writes the total amount and value for a specific blockchain.
     """
-    base_col = col - 1 + (col + 1) * 2
-    worksheet.write(num_wallets + 1, base_col, ticker, cell_format)
-    worksheet.write(num_wallets + 1, base_col + 1, round(total_amount, 4), cell_format)
-    worksheet.write(num_wallets + 1, base_col + 2, f'${round(total_in_chain, 2)}', cell_format)
+    write_cell(worksheet, col_widths, num_wallets + 1, base_col, ticker, formats['usd_cell'])
+    write_cell(worksheet, col_widths, num_wallets + 1, base_col + 1, total_amount, formats['total_amount_cell'])
+    write_cell(worksheet, col_widths, num_wallets + 1, base_col + 2, total_in_chain, formats['usd_cell'])
 
-def write_wallet_totals(worksheet, row, num_chains, total_in_wallet, total_balance, cell_format):
+def write_wallet_totals(worksheet, col_widths, row, base_col, total_in_wallet, total_balance, cell_format):
     """
     Write totals for a specific wallet.
 
     Args:
     worksheet (Worksheet): The Excel worksheet object.
+    col_widths (dict): Column widths tracked by write_cells.
     row (int): The row index for the current wallet.
-    num_chains (int): The number of blockchains.
+    base_col (int): The column of the wallet total, followed by the wallet balance.
     total_in_wallet (float): The total USD value in this wallet for the specific coin.
     total_balance (float): The total balance of the wallet across all coins.
     cell_format (Format): The Excel cell format to use.
 
     This function writes the total value and balance for a specific wallet.
     """
-    base_col = num_chains * 3
-    worksheet.write(row, base_col, f'${round(total_in_wallet, 2)}', cell_format)
-    worksheet.write(row, base_col + 1, f'${round(total_balance, 2)}', cell_format)
+    write_cells(worksheet, col_widths, row, base_col, [total_in_wallet, total_balance], cell_format)
 
-def write_totals(worksheet, num_wallets, num_headers, total_usd, total_all_chains, cell_format):
+def write_totals(worksheet, col_widths, num_wallets, base_col, total_usd, total_all_chains, cell_format):
     """
     Write the grand totals at the bottom of the sheet.
 
     Args:
     worksheet (Worksheet): The Excel worksheet object.
+    col_widths (dict): Column widths tracked by write_cells.
     num_wallets (int): The number of wallets.
-    num_headers (int): The number of header columns.
+    base_col (int): The 'CHAINS' column, followed by the 'TOTAL' column.
     total_usd (float): The total USD value across all wallets for the specific coin.
     total_all_chains (float): The total balance across all wallets and all coins.
     cell_format (Format): The Excel cell format to use.
 
     This function writes the grand total USD value and balance at the bottom of the sheet.
     """
-    base_col = (num_headers - 3) * 2
-    worksheet.write(num_wallets + 1, base_col, f'${round(total_usd, 2)}', cell_format)
-    worksheet.write(num_wallets + 1, base_col + 1, f'${round(total_all_chains, 2)}', cell_format)
+    write_cells(worksheet, col_widths, num_wallets + 1, base_col, [total_usd, total_all_chains], cell_format)
 
 def write_donation_info(worksheet, num_wallets, cell_format):
     """
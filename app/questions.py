@@ -27,6 +27,9 @@ THEME = {
     }
 }
 
+# Loaded once and shared by every prompt instead of being rebuilt per question
+_LOADED_THEME = loadth(THEME)
+
 def get_action() -> str:
     """Prompt the user to select an action."""
     question = [
@@ -41,7 +44,7 @@ def get_action() -> str:
             ],
         )
     ]
-    action = inquirer.prompt(question, theme=loadth(THEME))['action']
+    action = inquirer.prompt(question, theme=_LOADED_THEME)['action']
     return action
 
 def select_chains(chains: List[str]) -> List[str]:
@@ -57,7 +60,7 @@ def select_chains(chains: List[str]) -> List[str]:
             choices=["ALL NETWORKS", *chains],
         )
     ]
-    selected_chains = inquirer.prompt(question, theme=loadth(THEME))['chains']
+    selected_chains = inquirer.prompt(question, theme=_LOADED_THEME)['chains']
     return chains if 'ALL NETWORKS' in selected_chains else selected_chains
 
 def get_ticker() -> str:
@@ -65,7 +68,7 @@ def get_ticker() -> str:
     question = [
         inquirer.Text("ticker", message=colored("Enter the name (ticker) of the token", 'light_yellow'))
     ]
-    ticker = inquirer.prompt(question, theme=loadth(THEME))['ticker'].upper()
+    ticker = inquirer.prompt(question, theme=_LOADED_THEME)['ticker'].upper()
     return ticker
 
 def get_minimal_amount_in_usd() -> float:
@@ -82,7 +85,7 @@ def get_minimal_amount_in_usd() -> float:
             )
         ]
         try:
-            min_amount = float(inquirer.prompt(question, theme=loadth(THEME))['min_amount'].strip())
+            min_amount = float(inquirer.prompt(question, theme=_LOADED_THEME)['min_amount'].strip())
             return -1 if min_amount == 0 else min_amount
         except ValueError:
             logger.error('Error! Invalid input')
@@ -102,7 +105,7 @@ def get_num_of_threads() -> int:
         ]
         try:
             num_of_threads = int(
-                inquirer.prompt(question, theme=loadth(THEME))['num_of_threads'].strip()
+                inquirer.prompt(question, theme=_LOADED_THEME)['num_of_threads'].strip()
             )
             return 3 if num_of_threads == 0 else num_of_threads
         except ValueError:
@@ -15,12 +15,7 @@ Functions:
 """
 
 import sqlite3
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-
-# Connect to your SQLite database
-conn = sqlite3.connect('db/portfolio_history.db')
-cursor = conn.cursor()
+from contextlib import closing
 
 # Example query for total value over time by chain
 QUERY1 = """
@@ -35,20 +30,20 @@ FROM
 GROUP BY 
     i.run_date, c.name
 ORDER BY 
-    i.run_date, total_value DESC
+    i.run_date
 """
 
 # Example query for top tokens by value
 QUERY2 = """
+WITH latest AS (SELECT MAX(run_date) AS run_date FROM import_run)
 SELECT 
     t.name as token_name,
     SUM(wt.value) as total_value
 FROM 
-    wallet_token wt
+    latest
+    JOIN import_run i ON i.run_date = latest.run_date
+    JOIN wallet_token wt ON wt.import_run_id = i.id
     JOIN token t ON wt.token_id = t.id
-    JOIN import_run i ON wt.import_run_id = i.id
-WHERE 
-    i.run_date = (SELECT MAX(run_date) FROM import_run)
 GROUP BY 
     t.name
 ORDER BY 
@@ -56,44 +51,81 @@ ORDER BY
 LIMIT 10
 """
 
-# Execute queries
-cursor.execute(QUERY1)
-results1 = cursor.fetchall()
+def fetch_report_data(db_path):
+    """
+    Runs the report queries against the portfolio history database.
+
+    The rows of QUERY1 arrive ordered by date and are folded into per-chain series
+    while the cursor is iterated, without materializing the result set.
+
+    Args:
+        db_path (str): The path to the SQLite database file.
+
+    Returns:
+        tuple: The run dates in ascending order, a dict mapping each chain to its total
+        value per date (0 where the chain had no tokens), and the rows of QUERY2
+        (token, total value).
+    """
+    dates = []
+    values = {}
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+
+        for run_date, chain_name, total_value in conn.execute(QUERY1):
+            if not dates or dates[-1] != run_date:
+                dates.append(run_date)
+            series = values.setdefault(chain_name, [])
+            series.extend([0] * (len(dates) - 1 - len(series)))
+            series.append(total_value)
+
+        top_tokens = conn.execute(QUERY2).fetchall()
+
+    for series in values.values():
+        series.extend([0] * (len(dates) - len(series)))
+
+    return dates, values, top_tokens
+
+def generate_report(db_path='db/portfolio_history.db', out='blockchain_holdings_report.html'):
+    """
+    Builds the blockchain holdings report and saves it as an HTML file.
+
+    plotly is imported here rather than at module level, so importing this module
+    does not load it or touch the database.
 
-cursor.execute(QUERY2)
-results2 = cursor.fetchall()
+    Args:
+        db_path (str): The path to the SQLite database file.
+        out (str): The path of the HTML file to write.
 
-# Close the connection
-conn.close()
+    Returns:
+        None
+    """
+    # pylint: disable=import-outside-toplevel
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
 
-# Prepare data for plotting
-dates = list({r[0] for r in results1})
-chains = list({r[1] for r in results1})
-values = {chain: [0]*len(dates) for chain in chains}
+    dates, values, top_tokens = fetch_report_data(db_path)
 
-for r in results1:
-    date_index = dates.index(r[0])
-    values[r[1]][date_index] = r[2]
+    # Create subplots
+    fig = make_subplots(rows=2, cols=1, subplot_titles=("Total Value Over Time by Chain", "Top 10 Tokens by Value"))
 
-# Create subplots
-fig = make_subplots(rows=2, cols=1, subplot_titles=("Total Value Over Time by Chain", "Top 10 Tokens by Value"))
+    # Add traces for each chain
+    for chain, chain_values in values.items():
+        fig.add_trace(go.Scatter(x=dates, y=chain_values, name=chain, stackgroup='one'), row=1, col=1)
 
-# Add traces for each chain
-for chain in chains:
-    fig.add_trace(go.Scatter(x=dates, y=values[chain], name=chain, stackgroup='one'), row=1, col=1)
+    # Add bar chart for top tokens
+    fig.add_trace(go.Bar(x=[r[0] for r in top_tokens], y=[r[1] for r in top_tokens]), row=2, col=1)
 
-# Add bar chart for top tokens
-fig.add_trace(go.Bar(x=[r[0] for r in results2], y=[r[1] for r in results2]), row=2, col=1)
+    # Update layout
+    fig.update_layout(height=900, width=1200, title_text="Blockchain Holdings Report")
+    fig.update_xaxes(title_text="Date", row=1, col=1)
+    fig.update_xaxes(title_text="Token", row=2, col=1)
+    fig.update_yaxes(title_text="Total Value", row=1, col=1)
+    fig.update_yaxes(title_text="Value", row=2, col=1)
 
-# Update layout
-fig.update_layout(height=900, width=1200, title_text="Blockchain Holdings Report")
-fig.update_xaxes(title_text="Date", row=1, col=1)
-fig.update_xaxes(title_text="Token", row=2, col=1)
-fig.update_yaxes(title_text="Total Value", row=1, col=1)
-fig.update_yaxes(title_text="Value", row=2, col=1)
+    # Save to HTML, loading plotly.js from its CDN instead of embedding the bundle
+    fig.write_html(out, include_plotlyjs='cdn', full_html=True, auto_open=False)
 
-# Show the plot
-fig.show()
 
-# Optionally, save to HTML file
-fig.write_html("blockchain_holdings_report.html")
+if __name__ == "__main__":
+    generate_report()
@@ -1,14 +1,132 @@
 """This module provides utilities for managing Node.js subprocesses and handling HTTP requests."""
 
-import json
+import atexit
+import os
 import random
 import subprocess
+import threading
 from time import time, sleep
+from urllib.parse import urlsplit
 
 from loguru import logger
+import orjson
 import tls_client
 
-from app.config import NODE_SLEEP_TIME, SLEEP_TIME, FILE_JS
+from app.config import SLEEP_TIME, FILE_JS
+
+# Exponential backoff between retries of a failed request, in seconds
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# send_request gives up after this many attempts, or once retrying would pass the deadline
+REQUEST_MAX_ATTEMPTS = 8
+REQUEST_DEADLINE = 120.0
+# Responses that mean Cloudflare is rate limiting: retried after Retry-After and halve the limit below
+RATE_LIMIT_STATUS_CODES = (429, 503)
+# Upper bound on requests in flight across all threads: the limit starts at the number of
+# worker threads, is halved on rate limiting and raised by one after this many successes
+MAX_CONCURRENT_REQUESTS = 64
+CONCURRENCY_INCREASE_AFTER = 100
+
+# Time each worker thread's previous request finished, used to keep SLEEP_TIME between requests
+_request_pacing = threading.local()
+
+# (session, NodeProcess) pairs released by finished workers, waiting to be reused
+_idle_sessions = []
+_idle_sessions_lock = threading.Lock()
+
+# Value of the 'account' header, as json.dumps would render {'random_at', 'random_id', 'user_addr': None}
+_ACCOUNT_TEMPLATE = '{{"random_at": "{}", "random_id": "{}", "user_addr": null}}'
+
+# Headers every new session starts with; the x-api-* signature values are replaced before each request
+_BASE_HEADERS = {
+    'authority': 'api.debank.com',
+    'accept': '*/*',
+    'accept-language': 'ru-RU,ru;q=0.9',
+    'cache-control': 'no-cache',
+    'origin': 'https://debank.com',
+    'pragma': 'no-cache',
+    'referer': 'https://debank.com/',
+    'sec-ch-ua': '"Chromium";v="112", "Google Chrome";v="112", "Not:A-Brand";v="99"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Linux"',
+    'sec-fetch-dest': 'empty',
+    'sec-fetch-mode': 'cors',
+    'sec-fetch-site': 'same-site',
+    'source': 'web',
+    'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36',
+    'x-api-nonce': 'n_RT2KhwQF08JA3CwiTUOhUnel9ELZPGHDb2UgZLKh',
+    'x-api-sign': 'fb69dcdb900a27540c6fd9e13a08db75d16a2b917cfc33991e834552691a1a72',
+    'x-api-ts': '1690894427',
+    'x-api-ver': 'v2',
+}
+
+class AdaptiveLimiter:
+    """
+    Limits the number of requests in flight across all worker threads.
+
+    The limit adapts to Cloudflare's rate limiting: a 429 or 503 response halves it, based on the
+    number of requests actually in flight, and every CONCURRENCY_INCREASE_AFTER successful
+    responses raise it by one, up to the ceiling (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, ceiling):
+        self.ceiling = ceiling
+        self.limit = ceiling
+        self.in_flight = 0
+        self.successes = 0
+        self._condition = threading.Condition()
+
+    def reset(self, ceiling):
+        """
+        Sets a new ceiling and starts the limit at it again.
+
+        Args:
+            ceiling (int): The maximum number of requests in flight.
+        """
+        with self._condition:
+            self.ceiling = ceiling
+            self.limit = ceiling
+            self.successes = 0
+            self._condition.notify_all()
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent, then counts it as in flight.
+        """
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, status_code):
+        """
+        Counts a request as finished and adapts the limit to its outcome.
+
+        Args:
+            status_code (int or None): The response status code, or None if the request failed.
+        """
+        with self._condition:
+            if status_code in RATE_LIMIT_STATUS_CODES:
+                self.limit = max(1, min(self.limit, self.in_flight) // 2)
+                self.successes = 0
+            elif status_code == 200:
+                self.successes += 1
+                if self.successes >= CONCURRENCY_INCREASE_AFTER and self.limit < self.ceiling:
+                    self.limit += 1
+                    self.successes = 0
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+_request_limiter = AdaptiveLimiter(MAX_CONCURRENT_REQUESTS)
+
+def set_request_concurrency(num_of_threads):
+    """
+    Starts the shared request limit at the number of worker threads about to send requests.
+
+    Args:
+        num_of_threads (int): The number of worker threads, capped at MAX_CONCURRENT_REQUESTS.
+    """
+    _request_limiter.reset(max(1, min(num_of_threads, MAX_CONCURRENT_REQUESTS)))
 
 class NodeProcess:
     """
@@ -33,15 +151,14 @@ class NodeProcess:
         if self.process:
             self.close()
 
-        with subprocess.Popen(
+        # Not a with block: leaving it would close the pipes and wait for Node.js to exit
+        self.process = subprocess.Popen(  # pylint: disable=consider-using-with
             ['node', FILE_JS],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        ) as process:
-            self.process = process
-            logger.info("Node.js process started")
+            stderr=subprocess.DEVNULL
+        )
+        logger.info("Node.js process started")
 
     def __enter__(self):
         """
@@ -65,12 +182,13 @@ class NodeProcess:
 
     def write(self, data):
         """
-        Writes data to the Node.js subprocess.
+        Writes one length-prefixed message to the Node.js subprocess.
 
+        The message is sent as "<byte length>\\n<data>", the framing js/main.js reads.
         Attempts to write data to the subprocess, retrying up to 3 times if an error occurs.
 
         Args:
-            data: The data to write to the subprocess.
+            data (bytes): The message body to write to the subprocess.
 
         Raises:
             RuntimeError: If writing fails after multiple attempts.
@@ -78,8 +196,8 @@ class NodeProcess:
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                self.process.stdin.write(data)
-                self.process.stdin.flush()
+                self.stdin.write(f'{len(data)}\n'.encode() + data)
+                self.stdin.flush()
                 return
             except (ValueError, IOError) as e:
                 logger.error(f"Error writing to Node.js process (attempt {attempt + 1}): {e}")
@@ -89,21 +207,32 @@ class NodeProcess:
                 else:
                     raise RuntimeError("Failed to write to Node.js process after multiple attempts") from e
 
-    def readline(self):
+    def read_message(self):
         """
-        Reads a line from the Node.js subprocess.
+        Reads one length-prefixed message from the Node.js subprocess.
 
-        If an error occurs while reading, it restarts the subprocess and tries again.
+        Blocks until the whole reply has arrived, so no polling delay is needed.
+        If an error occurs while reading, it restarts the subprocess and returns an empty message.
 
         Returns:
-            str: The line read from the subprocess, stripped of whitespace.
+            bytes: The message body, or b'' if the subprocess closed its output.
         """
         try:
-            return self.process.stdout.readline().strip()
+            header = self.stdout.readline()
+            if not header:
+                return b''
+            return self.stdout.read(int(header))
         except (ValueError, IOError) as e:
             logger.error(f"Error reading from Node.js process: {e}")
             self._start_process()
-            return self.process.stdout.readline().strip()
+            return b''
+
+    def ensure_running(self):
+        """
+        Starts the Node.js subprocess again if it was closed or has exited.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self._start_process()
 
     def close(self):
         """
@@ -117,35 +246,35 @@ class NodeProcess:
             self.process.wait(timeout=5)
             self.process = None
 
-        @property
-        def stdin(self):
-            """
-            Get the stdin stream of the Node.js subprocess.
+    @property
+    def stdin(self):
+        """
+        Get the stdin stream of the Node.js subprocess.
 
-            If the subprocess is not currently running, this method will start it
-            before returning the stdin stream.
+        If the subprocess is not currently running, this method will start it
+        before returning the stdin stream.
 
-            Returns:
-                io.TextIOWrapper: The stdin stream of the Node.js subprocess.
-            """
-            if not self.process:
-                self._start_process()
-            return self.process.stdin
+        Returns:
+            io.BufferedWriter: The stdin stream of the Node.js subprocess.
+        """
+        if not self.process:
+            self._start_process()
+        return self.process.stdin
 
-        @property
-        def stdout(self):
-            """
-            Get the stdout stream of the Node.js subprocess.
+    @property
+    def stdout(self):
+        """
+        Get the stdout stream of the Node.js subprocess.
 
-            If the subprocess is not currently running, this method will start it
-            before returning the stdout stream.
+        If the subprocess is not currently running, this method will start it
+        before returning the stdout stream.
 
-            Returns:
-                io.TextIOWrapper: The stdout stream of the Node.js subprocess.
-            """
-            if not self.process:
-                self._start_process()
-            return self.process.stdout
+        Returns:
+            io.BufferedReader: The stdout stream of the Node.js subprocess.
+        """
+        if not self.process:
+            self._start_process()
+        return self.process.stdout
 
 def generate_req_params(node_process, payload, method, path):
     """
@@ -166,15 +295,14 @@ def generate_req_params(node_process, payload, method, path):
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            _json = json.dumps(payload)
-            node_process.write(f'{_json}|{method}|{path}\n')
-            sleep(NODE_SLEEP_TIME * 2)  # Increased sleep time
-            output_data = node_process.readline()
+            body = orjson.dumps(payload) if payload else b''
+            node_process.write(body + f'|{method}|{path}'.encode())
+            output_data = node_process.read_message()
             if not output_data:
                 raise ValueError("Empty response from Node.js process")
-            signature = json.loads(output_data)
+            signature = orjson.loads(output_data)
             return signature
-        except (ValueError, json.JSONDecodeError) as e:
+        except (ValueError, orjson.JSONDecodeError) as e:
             logger.error(f"Error in generate_req_params (attempt {attempt + 1}): {e}")
             if attempt < max_retries - 1:
                 logger.info("Retrying generate_req_params")
@@ -197,27 +325,24 @@ def edit_session_headers(node_process, session, payload, method, path):
         path (str): The path of the request.
     """
     sig = generate_req_params(node_process, payload, method, path)
-    session.headers['x-api-nonce'] = sig['nonce']
-    session.headers['x-api-sign'] = sig['signature']
-    session.headers['x-api-ts'] = str(sig['ts'])
-
-    abc = 'abcdef0123456789'
-    r_id = ''.join(random.choices(abc, k=32))
-    r_time = str(int(time()))
-    info = {
-        'random_at': r_time,
-        'random_id': r_id,
-        'user_addr': None
-    }
-    account = json.dumps(info)
-    session.headers['account'] = account
-
-def send_request(node_process, session, method, url, payload=None, params=None):
+    r_id = os.urandom(16).hex()
+    session.headers.update({
+        'x-api-nonce': sig['nonce'],
+        'x-api-sign': sig['signature'],
+        'x-api-ts': str(sig['ts']),
+        'account': _ACCOUNT_TEMPLATE.format(int(time()), r_id),
+    })
+
+def send_request(node_process, session, method, url, payload=None, params=None,
+                 max_attempts=REQUEST_MAX_ATTEMPTS, deadline=REQUEST_DEADLINE):
     """
     Sends an HTTP request and handles the response.
 
     This function attempts to send a request, handling various response scenarios
-    including success, rate limiting, and errors. It will retry the request if necessary.
+    including success, rate limiting, and errors. It will retry the request if necessary,
+    waiting as long as a 429 or 503 response's Retry-After header asks, or with exponential
+    backoff and jitter otherwise. It gives up after max_attempts attempts, or when the
+    next retry would start more than deadline seconds after the first attempt.
 
     Args:
         node_process (NodeProcess): The Node.js process to use for header updates.
@@ -226,6 +351,8 @@ def send_request(node_process, session, method, url, payload=None, params=None):
         url (str): The URL to send the request to.
         payload (dict, optional): The payload to send with the request. Defaults to None.
         params (dict, optional): The query parameters to send with the request. Defaults to None.
+        max_attempts (int, optional): The number of attempts to make. Defaults to REQUEST_MAX_ATTEMPTS.
+        deadline (float, optional): The time limit for all attempts in seconds. Defaults to REQUEST_DEADLINE.
 
     Returns:
         Response or None: The response object if successful, None otherwise.
@@ -235,27 +362,52 @@ def send_request(node_process, session, method, url, payload=None, params=None):
     if params is None:
         params = {}
 
-    while True:
+    started = time()
+    for attempt in range(max_attempts):
+        delay = None
         try:
             resp = _make_request(session, method, url, payload, params)
 
             if resp.status_code == 200:
                 return _handle_success(resp)
-            if resp.status_code == 429:
-                _handle_rate_limit(resp, session)
+            if resp.status_code in RATE_LIMIT_STATUS_CODES:
+                delay = _handle_rate_limit(resp, session)
             else:
                 _handle_error(resp, method, url, session, payload)
 
-        except (tls_client.exceptions.TLSClientExeption, json.JSONDecodeError) as error:
+        except (tls_client.exceptions.TLSClientExeption, orjson.JSONDecodeError) as error:
             logger.error(f'Unexpected error while sending request to {url}: {error}')
 
+        if delay is None:
+            delay = _backoff_delay(attempt)
+        if attempt == max_attempts - 1 or time() + delay - started > deadline:
+            break
         _update_headers(node_process, session, payload, params, method, url)
-        sleep(1)
+        sleep(delay)
+
+    logger.error(f'Giving up on {url} after {attempt + 1} attempts')
+    return None
+
+def _backoff_delay(attempt):
+    """
+    Computes the delay before the next retry of a request.
+
+    Args:
+        attempt (int): The number of retries already made, starting at 0.
+
+    Returns:
+        float: RETRY_BASE_DELAY doubled per attempt, capped at RETRY_MAX_DELAY, plus random jitter.
+    """
+    return min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY) + random.uniform(0, RETRY_BASE_DELAY)
 
 def _make_request(session, method, url, payload, params):
     """
     Makes an HTTP request using the provided session.
 
+    Waits first until at least SLEEP_TIME has passed since this thread's previous
+    request finished, so the caller's parsing of that response counts towards the gap,
+    and then for the shared AdaptiveLimiter to allow another request in flight.
+
     Args:
         session: The session object to use for the request.
         method (str): The HTTP method of the request.
@@ -266,9 +418,21 @@ def _make_request(session, method, url, payload, params):
     Returns:
         Response: The response object from the request.
     """
-    if method == 'GET':
-        return session.execute_request(method=method, url=url)
-    return session.request(method=method, url=url, json=payload, params=params)
+    gap = SLEEP_TIME - (time() - getattr(_request_pacing, 'last_finished', 0.0))
+    if gap > 0:
+        sleep(gap + random.uniform(0, 0.05))
+    _request_limiter.acquire()
+    status_code = None
+    try:
+        if method == 'GET':
+            resp = session.execute_request(method=method, url=url)
+        else:
+            resp = session.request(method=method, url=url, json=payload, params=params)
+        status_code = resp.status_code
+        return resp
+    finally:
+        _request_limiter.release(status_code)
+        _request_pacing.last_finished = time()
 
 def _handle_success(resp):
     """
@@ -277,11 +441,15 @@ def _handle_success(resp):
     Args:
         resp: The response object to handle.
 
+    The body is parsed once and attached to the response as resp.parsed, so callers
+    do not decode it again with resp.json().
+
     Returns:
         Response or None: The response object if it contains data, None otherwise.
     """
-    if 'data' in resp.text and resp.json():
-        sleep(random.uniform(SLEEP_TIME, SLEEP_TIME+0.05))
+    parsed = orjson.loads(resp.content)
+    if isinstance(parsed, dict) and 'data' in parsed:
+        resp.parsed = parsed
         return resp
     logger.error(f'Request not include data | Response: {resp.text}')
     return None
@@ -293,12 +461,20 @@ def _handle_rate_limit(resp, session):
     Args:
         resp: The response object to handle.
         session: The session object used for the request.
+
+    Returns:
+        float or None: The delay requested by a numeric Retry-After header plus jitter,
+        or None to fall back to exponential backoff.
     """
-    if 'Too Many' in resp.text:
+    if b'Too Many' in resp.content:
         logger.error(f"Too many requests | Headers: {session.headers['x-api-nonce']}")
-        sleep(random.uniform(SLEEP_TIME, SLEEP_TIME+0.05))
     else:
-        logger.error(f'Unknown request error | Response: {resp.text}')
+        logger.error(f'Rate limited with status {resp.status_code} | Response: {resp.text}')
+
+    try:
+        return max(0.0, float(resp.headers.get('Retry-After'))) + random.uniform(0, 0.25)
+    except (TypeError, ValueError):
+        return None
 
 def _handle_error(resp, method, url, session, payload):
     """
@@ -311,9 +487,10 @@ def _handle_error(resp, method, url, session, payload):
         session: The session object used for the request.
         payload (dict): The payload sent with the request.
     """
+    # Passed as arguments, so loguru only renders the headers and payload if a sink accepts the record
     logger.error(
-        f'Bad request status code: {resp.status_code} | Method: {method} | Response: {resp.text} | Url: {url} | '
-        f'Headers: {session.headers} | Payload: {payload}'
+        'Bad request status code: {} | Method: {} | Response: {} | Url: {} | Headers: {} | Payload: {}',
+        resp.status_code, method, resp.text, url, session.headers, payload
     )
 
 def _update_headers(node_process, session, payload, params, method, url):
@@ -329,44 +506,58 @@ def _update_headers(node_process, session, payload, params, method, url):
         url (str): The URL of the request.
     """
     if method == 'GET':
-        edit_session_headers(node_process, session, params, method, url.split('api.debank.com')[1].split('?')[0])
+        edit_session_headers(node_process, session, params, method, urlsplit(url).path)
     else:
         edit_session_headers(node_process, session, payload, method, url)
 
 def setup_session():
     """
-    Sets up a session with appropriate headers and creates a Node.js process.
+    Returns an idle session released by an earlier worker, or sets up a new one.
+
+    A reused tls_client session keeps its open connections to api.debank.com, so the
+    worker skips the TCP and TLS handshakes, and its Node.js process skips start-up.
+    The signature headers left on a reused session are replaced before every request.
 
     Returns:
-        tuple: A tuple containing the set up session and the created NodeProcess object.
+        tuple: A tuple containing the set up session and its NodeProcess object.
     """
+    with _idle_sessions_lock:
+        idle = _idle_sessions.pop() if _idle_sessions else None
+    if idle is not None:
+        session, node_process = idle
+        node_process.ensure_running()
+        return session, node_process
+
     session = tls_client.Session(
         client_identifier="chrome112",
         random_tls_extension_order=True
     )
 
-    headers = {
-        'authority': 'api.debank.com',
-        'accept': '*/*',
-        'accept-language': 'ru-RU,ru;q=0.9',
-        'cache-control': 'no-cache',
-        'origin': 'https://debank.com',
-        'pragma': 'no-cache',
-        'referer': 'https://debank.com/',
-        'sec-ch-ua': '"Chromium";v="112", "Google Chrome";v="112", "Not:A-Brand";v="99"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"Linux"',
-        'sec-fetch-dest': 'empty',
-        'sec-fetch-mode': 'cors',
-        'sec-fetch-site': 'same-site',
-        'source': 'web',
-        'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36',
-        'x-api-nonce': 'n_RT2KhwQF08JA3CwiTUOhUnel9ELZPGHDb2UgZLKh',
-        'x-api-sign': 'fb69dcdb900a27540c6fd9e13a08db75d16a2b917cfc33991e834552691a1a72',
-        'x-api-ts': '1690894427',
-        'x-api-ver': 'v2',
-    }
-    session.headers = headers
-
-    node_process = NodeProcess()
-    return session, node_process
+    session.headers = dict(_BASE_HEADERS)
+
+    return session, NodeProcess()
+
+def release_session(session, node_process):
+    """
+    Hands a session and its NodeProcess back for reuse by a later worker.
+
+    A session must not be used by two threads at once, since its signature headers
+    are rewritten for every request. Idle Node.js processes are closed at interpreter
+    exit by close_idle_sessions.
+
+    Args:
+        session: A session obtained from setup_session.
+        node_process (NodeProcess): The NodeProcess returned with it.
+    """
+    with _idle_sessions_lock:
+        _idle_sessions.append((session, node_process))
+
+def close_idle_sessions():
+    """
+    Closes the NodeProcess of every idle session. Registered with atexit.
+    """
+    with _idle_sessions_lock:
+        while _idle_sessions:
+            _idle_sessions.pop()[1].close()
+
+atexit.register(close_idle_sessions)
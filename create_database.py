@@ -4,12 +4,14 @@ This script creates a SQLite database using a provided schema file.
 
 It includes a function to:
 - Create a database and execute the schema script to set up the database structure.
+- Add the indexes of the schema to a database created before they existed.
 
 Functions:
 - create_database: Connects to a SQLite database, reads the schema from a file, and executes it.
 
 Usage:
-- Run this script directly to create the database with the specified name and schema file.
+- Run this script directly to create the database with the specified name and schema file,
+  or to migrate an existing database.
 
 Example:
     $ python create_database.py
@@ -26,6 +28,12 @@ import sqlite3
 from app.config import DB_FILE
 from app.config import SCHEMA_FILE
 
+# Indexes of sql/schema.sql added after its first version, for databases created before them
+INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_import_run_run_date ON import_run (run_date);
+CREATE INDEX IF NOT EXISTS idx_wallet_token_import_run ON wallet_token (import_run_id);
+"""
+
 def create_database(db_name: str, schema_file: str):
     """
     Create a SQLite database using the provided schema file.
@@ -37,12 +45,22 @@ def create_database(db_name: str, schema_file: str):
     This function connects to the specified SQLite database (or creates it if it doesn't exist),
     reads the SQL schema from the provided file, and executes the schema to set up the database
     structure. The connection is then committed and closed.
+
+    The page size is fixed before any table exists, and the database is switched to WAL
+    journaling, which is stored in the file so every later connection starts in WAL mode.
+
+    If the database already has the schema, only the missing indexes are created.
     """
     conn = sqlite3.connect(db_name)
-    with open(schema_file, 'r', encoding='utf-8') as f:
-        schema = f.read()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'import_run'").fetchone():
+        conn.executescript(INDEXES_SQL)
+    else:
+        conn.execute("PRAGMA page_size=4096")
+        conn.execute("PRAGMA journal_mode=WAL")
+        with open(schema_file, 'r', encoding='utf-8') as f:
+            schema = f.read()
 
-    conn.executescript(schema)
+        conn.executescript(schema)
     conn.commit()
     conn.close()
 
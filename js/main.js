@@ -143,17 +143,32 @@ function r(A, e, a) {
                 version: d
             }
         }
-    process.stdin.setEncoding('utf8');
-    process.stdin.on('data', (data) => {
-        const input = data.trim();
+    // Messages in both directions are framed as "<byte length>\n<body>", so a
+    // request split across (or merged into) stdin chunks is still read whole.
+    let pending = Buffer.alloc(0);
+    process.stdin.on('data', (chunk) => {
+        pending = Buffer.concat([pending, chunk]);
+        for (;;) {
+            const headerEnd = pending.indexOf(10);
+            if (headerEnd === -1) break;
+            const length = parseInt(pending.toString('utf8', 0, headerEnd), 10);
+            const end = headerEnd + 1 + length;
+            if (pending.length < end) break;
+            const input = pending.toString('utf8', headerEnd + 1, end);
+            pending = pending.subarray(end);
 
-        let payload = JSON.parse(input.split('|')[0])
-        let method = input.split('|')[1]
-        let url_path = input.split('|')[2]
-        U.set_sign_type(100120)
-        signature = r(payload, method, url_path)
+            // An empty payload field stands for {}, so callers can skip serialising it
+            const fields = input.split('|')
+            let payload = fields[0] ? JSON.parse(fields[0]) : {}
+            let method = fields[1]
+            let url_path = fields[2]
+            U.set_sign_type(100120)
+            const signature = r(payload, method, url_path)
 
-        process.stdout.write(JSON.stringify(signature) + '\n');
+            const reply = Buffer.from(JSON.stringify(signature));
+            process.stdout.write(reply.length + '\n');
+            process.stdout.write(reply);
+        }
     });
 }
 
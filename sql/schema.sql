@@ -7,7 +7,7 @@ CREATE TABLE import_run (
 -- Token Table
 CREATE TABLE token (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL
+    name TEXT NOT NULL UNIQUE
 );
 
 -- Wallet Table
@@ -60,4 +60,8 @@ CREATE TABLE pool (
     FOREIGN KEY (wallet_id) REFERENCES wallet(id),
     FOREIGN KEY (chain_id) REFERENCES chain(id),
     FOREIGN KEY (protocol_id) REFERENCES protocol(id)
-);
\ No newline at end of file
+);
+
+-- Indexes for the report queries: latest run lookup and per-run token values
+CREATE INDEX idx_import_run_run_date ON import_run (run_date);
+CREATE INDEX idx_wallet_token_import_run ON wallet_token (import_run_id);
@@ -4,12 +4,14 @@ This script initializes and runs the main application for checking blockchain ba
 """
 
 
-import threading
 import argparse
+import threading
 
-from queue import Queue
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from time import time
-import requests
+from urllib.parse import urlencode
 from termcolor import colored
 from art import text2art
 from alive_progress import alive_bar
@@ -19,40 +21,72 @@ from app.questions import (
     get_minimal_amount_in_usd, get_num_of_threads,
     select_chains, get_action, get_ticker
 )
-from app.config import DB_FILE, FILE_EXCEL, FILE_WALLETS
-from app.utils import edit_session_headers, send_request, setup_session, logger
+from app.api_cache import get_cached, set_cached, set_cache_ttl
+from app.config import API_CACHE_TTL, DB_FILE, DISCOVERY_THREADS, FILE_EXCEL, FILE_WALLETS
+from app.utils import (
+    edit_session_headers, send_request, setup_session, release_session, set_request_concurrency, logger
+)
 from app.db_operations import save_to_database
 
-def chain_balance(node_process, session, address, chain, ticker, min_amount):
-    """Retrieve the balance of a specific cryptocurrency for a given address and chain."""
-    coins = []
+def get_api_data(node_process, session, path, params):
+    """
+    Signs and sends a GET request to a Debank API endpoint and returns the 'data' of the response.
 
-    payload = {
-        'user_addr': address,
-        'chain': chain
-    }
-    edit_session_headers(node_process, session, payload, 'GET', '/token/balance_list')
+    Successful responses are cached on disk by app.api_cache, so running another menu action or
+    re-running the script on the same wallets does not request the same chains, pools and
+    balances again.
+
+    Args:
+        node_process: The Node.js process used to sign the request.
+        session: The session object used to make the request.
+        path (str): The endpoint path, e.g. '/user/used_chains'.
+        params (dict): The query parameters, also used as the signed payload.
+
+    Returns:
+        The 'data' field of the response, or None if the request failed.
+    """
+    key = f'{path}?{urlencode(params)}'
+    data = get_cached(key)
+    if data is not None:
+        return data
+
+    edit_session_headers(node_process, session, params, 'GET', path)
 
     resp = send_request(
         node_process,
         session=session,
         method='GET',
-        url=f'https://api.debank.com/token/balance_list?user_addr={address}&chain={chain}',
+        url=f'https://api.debank.com{key}',
+        params=params,
     )
+    if resp is None:
+        return None
 
-    for coin in resp.json()['data']:
-        if ticker in (None, coin['optimized_symbol']):
-            coin_in_usd = '?' if coin["price"] is None else coin["amount"] * coin["price"]
-            if isinstance(coin_in_usd, str) or (isinstance(coin_in_usd, float) and coin_in_usd > min_amount):
-                coins.append({
-                    'amount': coin['amount'],
-                    'name': coin['name'],
-                    'ticker': coin['optimized_symbol'],
-                    'price': coin['price'],
-                    'logo_url': coin['logo_url']
-                })
+    data = resp.parsed['data']
+    if data is not None:
+        set_cached(key, data)
+    return data
 
-    return coins
+def chain_balance(node_process, session, address, chain, ticker, min_amount):
+    """Retrieve the balance of a specific cryptocurrency for a given address and chain, or None if the request failed."""
+    data = get_api_data(node_process, session, '/token/balance_list', {'user_addr': address, 'chain': chain})
+    if data is None:
+        logger.warning(f"No {chain} balances for wallet {address}")
+        return None
+
+    # Coins without a price are kept since their value in USD is unknown
+    return [
+        {
+            'amount': coin['amount'],
+            'name': coin['name'],
+            'ticker': symbol,
+            'price': price,
+            'logo_url': coin['logo_url']
+        }
+        for coin in data
+        if (symbol := coin['optimized_symbol']) == ticker or ticker is None
+        if (price := coin['price']) is None or coin['amount'] * price > min_amount
+    ]
 
 def show_help():
     """Display help information for the user."""
@@ -72,7 +106,8 @@ def show_help():
         '> The first is the sum of coins in $ in selected networks and pools, the second is the sum of '
         'coins in $ across all networks\n\n'
         '> Why is getting the list of networks used on wallets so slow?\n'
-        '> Because Cloudflare strongly restricts this request, so the work is done in single-thread mode\n\n'
+        '> Because Cloudflare strongly restricts this request, so it only runs in a few threads '
+        '(DISCOVERY_THREADS in app/config.py, set it to 1 if you get blocked)\n\n'
         '> Other questions?\n'
         '> Write to us in the chat https://t.me/cryptogovnozavod_chat\n'
         '--------------------- HELP ---------------------\n'
@@ -80,286 +115,293 @@ def show_help():
     print(help_text)
 
 def get_used_chains(node_process, session, address):
-    """Get the list of chains used by a specific address."""
-    payload = {
-        'id': address,
-    }
-    edit_session_headers(node_process, session, payload, 'GET', '/user/used_chains')
-
-    resp = send_request(
-        node_process,
-        session=session,
-        method='GET',
-        url=f'https://api.debank.com/user/used_chains?id={address}',
-    )
+    """Get the list of chains used by a specific address, or None if the request failed."""
+    data = get_api_data(node_process, session, '/user/used_chains', {'id': address})
+    if data is None:
+        logger.warning(f"No used chains for wallet {address}")
+        return None
 
-    chains = resp.json()['data']['chains']
+    chains = data['chains']
 
     return chains
 
-def get_chains(node_process, session, wallets):
-    """Get the list of chains used by all wallets."""
-    chains = set()
+def map_wallets(func, wallets, num_of_threads):
+    """
+    Calls func(node_process, session, wallet) for every wallet on a few threads, with a progress bar.
 
-    with alive_bar(len(wallets)) as a_bar:
-        for wallet in wallets:
-            chains = chains.union(get_used_chains(node_process, session, wallet))
-            a_bar.next()
+    Thread i handles every num_of_threads-th wallet starting at wallet i, using its own
+    session from setup_session, since a session must not be shared between threads.
+    An error raised for one wallet is logged and gives None for it, so the other wallets
+    of the phase are kept.
 
-    print()
-    return chains
+    Args:
+        func: The function to call for each wallet.
+        wallets (list): The wallet addresses.
+        num_of_threads (int): The number of threads to run.
 
-def get_wallet_balance(node_process, session, address):
-    """Get the total balance of a wallet."""
-    payload = {
-        'user_addr': address,
-    }
-    edit_session_headers(node_process, session, payload, 'GET', '/asset/net_curve_24h')
+    Returns:
+        list: The results of func, or None where it raised, in the order of wallets.
+    """
+    num_of_threads = max(1, min(num_of_threads, len(wallets)))
+    set_request_concurrency(num_of_threads)
+    # alive_progress does not lock its counter, so workers advance the bar one at a time
+    bar_lock = threading.Lock()
 
-    resp = send_request(
-        node_process,
-        session=session,
-        method='GET',
-        url=f'https://api.debank.com/asset/net_curve_24h?user_addr={address}',
-    )
+    def run_stripe(first):
+        session, node_process = setup_session()
+        try:
+            stripe_results = []
+            for wallet in wallets[first::num_of_threads]:
+                try:
+                    stripe_results.append(func(node_process, session, wallet))
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logger.error(f"Error processing wallet {wallet}: {e!r}")
+                    stripe_results.append(None)
+                with bar_lock:
+                    a_bar()  # pylint: disable=not-callable
+            return stripe_results
+        finally:
+            release_session(session, node_process)
+
+    results = [None] * len(wallets)
+    with alive_bar(len(wallets)) as a_bar, ThreadPoolExecutor(max_workers=num_of_threads) as executor:
+        for first, stripe_results in enumerate(executor.map(run_stripe, range(num_of_threads))):
+            results[first::num_of_threads] = stripe_results
+    return results
 
-    usd_value = resp.json()['data']['usd_value_list'][-1][1]
+def get_wallet_balance(node_process, session, address):
+    """Get the total balance of a wallet, or None if the request failed."""
+    data = get_api_data(node_process, session, '/asset/net_curve_24h', {'user_addr': address})
+    if data is None:
+        logger.warning(f"No total balance for wallet {address}")
+        return None
+
+    usd_value = data['usd_value_list'][-1][1]
 
     return usd_value
 
-def get_pools(node_process, session, wallets):
+def get_pool(node_process, session, address):
     """
-    Retrieve pools for a list of wallets.
+    Retrieve pool information for a single wallet address.
+
+    This function makes a request to the Debank API to get the pool information
+    for a given wallet address and processes the response to extract relevant
+    data.
 
-    This function iterates over a list of wallets and retrieves the pool information
-    for each wallet by making requests to the Debank API. It uses a progress bar to
-    indicate the progress of the operation.
+    Errors are logged and give None, so the wallet is reported as failed without stopping the others.
 
     Args:
         node_process: The Node.js process used to handle requests.
-        session: The requests session object used to make HTTP requests.
-        wallets (list): A list of wallet addresses to retrieve pool information for.
+        session: The tls_client session used to make HTTP requests.
+        address (str): The wallet address to retrieve pool information for.
 
     Returns:
-        dict: A dictionary where keys are pool names and values are dictionaries
-              mapping wallet addresses to their respective pool data.
+        dict: A dictionary where keys are pool names and values are lists of
+              assets in the pool, or None if the request or parsing failed.
     """
-    def get_pool(session, address):
-        """
-        Retrieve pool information for a single wallet address.
-
-        This function makes a request to the Debank API to get the pool information
-        for a given wallet address and processes the response to extract relevant
-        data.
-
-        Args:
-            session: The requests session object used to make HTTP requests.
-            address (str): The wallet address to retrieve pool information for.
-
-        Returns:
-            dict: A dictionary where keys are pool names and values are lists of
-                  assets in the pool.
-        """
-        pools = {}
-        payload = {
-            'user_addr': address,
-        }
-        edit_session_headers(node_process, session, payload, 'GET', '/portfolio/project_list')
-
-        resp = send_request(
-            node_process,
-            session=session,
-            method='GET',
-            url=f'https://api.debank.com/portfolio/project_list?user_addr={address}',
-        )
-
-        data = resp.json().get('data', [])
-        if not data:
+    pools = {}
+    try:
+        data = get_api_data(node_process, session, '/portfolio/project_list', {'user_addr': address})
+        if data is None:
             logger.warning(f"No data returned for wallet {address}")
-            return pools
+            return None
 
         for pool in data:
-            pool_name = f"{pool['name']} ({pool['chain']})"
-            pools[pool_name] = []
-            for item in pool.get('portfolio_item_list', []):
-                for coin in item.get('asset_token_list', []):
-                    pools[pool_name].append({
-                        'amount': coin.get('amount'),
-                        'name': coin.get('name'),
-                        'ticker': coin.get('optimized_symbol'),
-                        'price': coin.get('price'),
-                        'logo_url': coin.get('logo_url')
-                    })
-
-        return pools
-
-    all_pools = {}
-
-    with alive_bar(len(wallets)) as a_bar:
-        for wallet in wallets:
-            try:
-                pools = get_pool(session, wallet)
-                for pool_name, pool_data in pools.items():
-                    if pool_name not in all_pools:
-                        all_pools[pool_name] = {}
-                    all_pools[pool_name][wallet] = pool_data
-            except (requests.RequestException, ValueError, KeyError) as e:
-                logger.error(f"Error getting pools for wallet {wallet}: {str(e)}")
-            a_bar.next()
-
-    for pool_data in all_pools.items():
-        for wallet in wallets:
-            if wallet not in pool_data:
-                pool_data[wallet] = []
-
-    logger.info(f"Found {len(all_pools)} pools")
-    return all_pools
-
-def worker(queue_tasks, queue_results):
-    """Worker function for processing tasks in parallel."""
-    session, node_process = setup_session()
-
-    while True:
-        task = queue_tasks.get()
-        if task[0] == 'chain_balance':
-            balance = chain_balance(node_process, session, task[1], task[2], task[3], task[4])
-            queue_results.put((task[2], task[1], balance))
-        elif task[0] == 'get_wallet_balance':
-            balance = get_wallet_balance(node_process, session, task[1])
-            queue_results.put((task[1], balance))
-        elif task[0] == 'done':
-            queue_tasks.put(('done',))
-            break
+            pools[f"{pool['name']} ({pool['chain']})"] = [
+                {
+                    'amount': coin.get('amount'),
+                    'name': coin.get('name'),
+                    'ticker': coin.get('optimized_symbol'),
+                    'price': coin.get('price'),
+                    'logo_url': coin.get('logo_url')
+                }
+                for item in pool.get('portfolio_item_list', [])
+                for coin in item.get('asset_token_list', [])
+            ]
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.error(f"Error getting pools for wallet {address}: {str(e)}")
+        return None
+
+    return pools
+
+def wallet_chains_and_pools(node_process, session, address):
+    """Get the chains used by a wallet and its pools."""
+    return get_used_chains(node_process, session, address), get_pool(node_process, session, address)
+
+def get_chains_and_pools(wallets):
+    """
+    Retrieve the chains used by all wallets and the pools of each wallet.
 
-def process_balances(wallets, selected_chains, ticker, min_amount, num_of_threads, pools):
-    """Process balances for all wallets."""
-    coins = {chain: {} for chain in selected_chains}
-    pools_names = list(pools.keys())
+    Both requests for a wallet are made back to back by one of DISCOVERY_THREADS threads,
+    so chains and pools are discovered in a single pass over the wallets. A progress bar
+    indicates the progress of the operation.
 
-    queue_tasks = Queue()
-    queue_results = Queue()
+    Args:
+        wallets (list): A list of wallet addresses.
 
-    threads = []
-    for _ in range(num_of_threads):
-        th = threading.Thread(target=worker, args=(queue_tasks, queue_results))
-        threads.append(th)
-        th.start()
+    Returns:
+        tuple: The set of used chains, a dictionary where keys are pool names and
+               values are dictionaries mapping the wallet addresses that have the pool
+               to their pool data, and the set of wallets whose requests failed.
+    """
+    chains = set()
+    all_pools = defaultdict(dict)
+    failed_wallets = set()
 
     start_time = time()
-    for chain_id, chain in enumerate(selected_chains):
-        if chain not in pools_names:
-            logger.info(f'[{chain_id + 1}/{len(selected_chains) - len(set(selected_chains) & set(pools_names))}] '
-                        f'Getting balance in network {chain.upper()}...')
+    results = map_wallets(wallet_chains_and_pools, wallets, DISCOVERY_THREADS)
+    for wallet, result in zip(wallets, results):
+        wallet_chains, pools = result or (None, None)
+        if wallet_chains is None or pools is None:
+            failed_wallets.add(wallet)
+        chains.update(wallet_chains or ())
+        for pool_name, pool_data in (pools or {}).items():
+            all_pools[pool_name][wallet] = pool_data
 
-            for wallet in wallets:
-                queue_tasks.put(('chain_balance', wallet, chain, ticker, min_amount))
+    print()
+    logger.info(f'Checked {len(wallets)} wallets in {time() - start_time:.1f} s')
+    logger.info(f"Found {len(all_pools)} pools")
+    return chains, dict(all_pools), failed_wallets
 
-            with alive_bar(len(wallets)) as a_bar:
-                for _ in wallets:
-                    result = queue_results.get()
-                    coins[result[0]][result[1]] = result[2]
-                    a_bar.next()
+def wallet_balances(node_process, session, address, chains, ticker, min_amount):
+    """Retrieve the coins of a wallet in each of the given chains, and its total balance."""
+    coins = {chain: chain_balance(node_process, session, address, chain, ticker, min_amount) for chain in chains}
+    return coins, get_wallet_balance(node_process, session, address)
 
-    print()
-    logger.info('Getting balance in all networks for each wallet')
-    for wallet in wallets:
-        queue_tasks.put(('get_wallet_balance', wallet))
+def process_balances(wallets, selected_chains, ticker, min_amount, num_of_threads, pools):
+    """Process balances for all wallets, also returning the wallets whose requests failed."""
+    # Every selected chain gets an entry for every wallet, so the writers need no gap filling
+    coins = {chain: {wallet: [] for wallet in wallets} for chain in selected_chains}
+    pools_names = set(pools)
+
+    start_time = time()
+    balance_chains = [chain for chain in selected_chains if chain not in pools_names]
+    logger.info(f'Getting balance in {len(balance_chains)} networks and in all networks for each wallet...')
 
+    # Each thread requests all chains of one wallet back to back, then the results are regrouped by chain
+    get_wallet_balances = partial(wallet_balances, chains=balance_chains, ticker=ticker, min_amount=min_amount)
     balances = {}
-    with alive_bar(len(wallets)) as a_bar:
-        for _ in wallets:
-            result = queue_results.get()
-            balances[result[0]] = result[1]
-            a_bar.next()
+    failed_wallets = set()
+    for wallet, result in zip(wallets, map_wallets(get_wallet_balances, wallets, num_of_threads)):
+        wallet_coins, balance = result or ({}, None)
+        for chain, chain_coins in wallet_coins.items():
+            if chain_coins is None:
+                failed_wallets.add(wallet)
+            else:
+                coins[chain][wallet] = chain_coins
+        if balance is None:
+            failed_wallets.add(wallet)
+        balances[wallet] = balance or 0
+    print()
 
-    # Add pool balances to coins
+    # Add balances of the selected pools to coins
     for pool_name, pool_data in pools.items():
-        coins[pool_name] = pool_data
-
-    queue_tasks.put(('done',))
-    for th in threads:
-        th.join()
+        if pool_name in coins:
+            coins[pool_name].update(pool_data)
 
-    return coins, balances, start_time
-
-def get_balances(wallets, ticker=None, auto_import=False, session=None, node_process=None):
-    """Get balances for all wallets."""
-    if session is None or node_process is None:
-        session, node_process = setup_session()
+    return coins, balances, start_time, failed_wallets
 
-    logger.info('Getting list of networks used on wallets...')
-    chains = list(get_chains(node_process, session, wallets))
-    logger.info('Getting list of pools and wallet balances in them...')
-    pools = get_pools(node_process, session, wallets)
-    logger.success(f'Done! Total networks and pools: {len(chains) + len(pools)}\n')
+def get_balances(wallets, ticker=None, auto_import=False, max_concurrency=1):
+    """Get balances for all wallets, using max_concurrency worker threads in auto-import mode."""
+    logger.info('Getting list of networks and pools used on wallets...')
+    chains, pools, failed_wallets = get_chains_and_pools(wallets)
+    chains_and_pools = [*chains, *pools]
+    logger.success(f'Done! Total networks and pools: {len(chains_and_pools)}\n')
 
     if auto_import:
         min_amount = 7
-        selected_chains = chains + list(pools)
-        num_of_threads = 1
+        selected_chains = chains_and_pools
+        num_of_threads = max_concurrency
     else:
         min_amount = get_minimal_amount_in_usd()
-        selected_chains = select_chains(chains + list(pools))
+        selected_chains = select_chains(chains_and_pools)
         num_of_threads = get_num_of_threads()
+    # Duplicate choices would give the writers duplicate columns and rows
+    selected_chains = list(dict.fromkeys(selected_chains))
 
-    coins, balances, start_time = process_balances(wallets, selected_chains, ticker, min_amount, num_of_threads, pools)
-
-    # Restructure coins to match expected format
-    restructured_coins = {chain: {wallet: [] for wallet in wallets} for chain in selected_chains}
-    for chain in selected_chains:
-        for wallet in wallets:
-            if chain in coins and wallet in coins[chain]:
-                restructured_coins[chain][wallet] = coins[chain][wallet]
+    coins, balances, start_time, failed_balances = process_balances(
+        wallets, selected_chains, ticker, min_amount, num_of_threads, pools
+    )
+    failed_wallets |= failed_balances
+    if failed_wallets:
+        logger.error(
+            f'Requests failed for {len(failed_wallets)} wallets, their data is incomplete: '
+            f'{", ".join(sorted(failed_wallets))}'
+        )
 
     # Save output
     if auto_import:
-        save_to_database(DB_FILE, wallets, selected_chains, restructured_coins, pools)
+        # Incomplete wallets are left out of the import run rather than stored with missing balances
+        if failed_wallets:
+            logger.warning(f'Leaving {len(failed_wallets)} wallets out of the import run')
+            wallets = [wallet for wallet in wallets if wallet not in failed_wallets]
+            coins = {
+                chain: {wallet: wallet_coins for wallet, wallet_coins in chain_coins.items() if wallet not in failed_wallets}
+                for chain, chain_coins in coins.items()
+            }
+            pools = {
+                pool_name: {wallet: data for wallet, data in pool_data.items() if wallet not in failed_wallets}
+                for pool_name, pool_data in pools.items()
+            }
+        save_to_database(DB_FILE, wallets, selected_chains, coins, pools)
         logger.success('Done! Data saved to database')
     else:
         if ticker is None:
-            save_full_to_excel(wallets, selected_chains, restructured_coins, balances)
+            save_full_to_excel(wallets, selected_chains, coins, balances)
         else:
-            save_selected_to_excel(wallets, selected_chains, restructured_coins, balances, ticker)
+            save_selected_to_excel(wallets, selected_chains, coins, balances, ticker)
         print()
         logger.success(f'Done! Table saved in {FILE_EXCEL}')
 
     logger.info(f'Time taken: {round((time() - start_time) / 60, 1)} min.\n')
 
+def iter_wallets(path):
+    """Yield normalized wallet addresses from a file, one line at a time, skipping blank and # comment lines."""
+    with open(path, 'r', encoding='utf-8') as file:
+        for row in file:
+            address = row.strip().lower()
+            if address and not address.startswith('#'):
+                yield address
+
 def main():
     """Main function to run the application."""
     art = text2art(text="DEBANK   CHECKER", font="standart")
     print(colored(art, 'light_blue'))
     print(colored('Author: t.me/cryptogovnozavod\n', 'light_cyan'))
 
-    with open(FILE_WALLETS, 'r', encoding='utf-8') as file:
-        wallets = [row.strip().lower() for row in file]
+    # Addresses listed more than once are only requested once
+    addresses = list(iter_wallets(FILE_WALLETS))
+    wallets = tuple(dict.fromkeys(addresses))
+    if len(wallets) != len(addresses):
+        logger.warning(f'Skipped {len(addresses) - len(wallets)} duplicate addresses')
 
     logger.success(f'Successfully loaded {len(wallets)} addresses\n')
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--auto-import', action='store_true', help='Run automatic import on all chains')
+    parser.add_argument('--no-cache', action='store_true', help='Request everything again instead of reusing cached responses')
+    parser.add_argument('--cache-ttl', type=float, default=API_CACHE_TTL,
+                        help=f'Reuse cached responses fetched less than this many seconds ago (default {API_CACHE_TTL})')
+    parser.add_argument('--max-concurrency', type=int, default=1,
+                        help='Worker threads for --auto-import; rate-limited requests are throttled further automatically')
     args = parser.parse_args()
+    set_cache_ttl(0 if args.no_cache else args.cache_ttl)
 
-    session, node_process = setup_session()
-
-    try:
-        if args.auto_import:
-            get_balances(wallets, auto_import=True, session=session, node_process=node_process)
-        else:
-            while True:
-                action = get_action()
-
-                if action == 'Get balances for all tokens in wallets':
-                    get_balances(wallets, session=session, node_process=node_process)
-                elif action == 'Get balance for a specific token only':
-                    ticker = get_ticker()
-                    get_balances(wallets, ticker, session=session, node_process=node_process)
-                elif action == 'Help':
-                    show_help()
-                elif action == 'Exit':
-                    break
-    finally:
-        node_process.close()
+    if args.auto_import:
+        get_balances(wallets, auto_import=True, max_concurrency=args.max_concurrency)
+    else:
+        while True:
+            action = get_action()
+
+            if action == 'Get balances for all tokens in wallets':
+                get_balances(wallets)
+            elif action == 'Get balance for a specific token only':
+                ticker = get_ticker()
+                get_balances(wallets, ticker)
+            elif action == 'Help':
+                show_help()
+            elif action == 'Exit':
+                break
 
 if __name__ == '__main__':
     main()